@@ -5,12 +5,11 @@ Provides helper functions for the AI agent to interact with the CRM database
 and perform operations autonomously.
 """
 
-from app import app, db
+from app import app, db, _import_lead_csv
 from models import Lead, Campaign, Sequence, Inbox, SentEmail, Response, CampaignLead
 from email_handler import EmailSender, EmailReceiver, EmailPersonalizer
 from datetime import datetime, timedelta
 from sqlalchemy import func
-import csv
 from typing import List, Dict, Optional
 
 
@@ -49,36 +48,9 @@ class CRMAgent:
     def import_leads_from_csv(self, csv_path: str) -> dict:
         """Import leads from CSV file"""
         with self.app.app_context():
-            imported = 0
-            skipped = 0
-            errors = []
-
             try:
                 with open(csv_path, 'r') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        email = row.get('email', '').strip()
-                        if not email:
-                            skipped += 1
-                            continue
-
-                        # Check if exists
-                        if Lead.query.filter_by(email=email).first():
-                            skipped += 1
-                            continue
-
-                        lead = Lead(
-                            email=email,
-                            first_name=row.get('first_name', '').strip(),
-                            last_name=row.get('last_name', '').strip(),
-                            company=row.get('company', '').strip(),
-                            website=row.get('website', '').strip(),
-                            source='csv_import_agent'
-                        )
-                        db.session.add(lead)
-                        imported += 1
-
-                db.session.commit()
+                    imported, skipped = _import_lead_csv(f, 'csv_import_agent')
                 return {
                     "success": True,
                     "imported": imported,
@@ -204,6 +176,9 @@ class CRMAgent:
             if not campaign:
                 return {"success": False, "message": "Campaign not found"}
 
+            if campaign.status == 'active':
+                return {"success": True, "message": f"Campaign '{campaign.name}' is already active"}
+
             campaign.status = 'active'
             db.session.commit()
 
@@ -216,6 +191,9 @@ class CRMAgent:
             if not campaign:
                 return {"success": False, "message": "Campaign not found"}
 
+            if campaign.status == 'paused':
+                return {"success": True, "message": f"Campaign '{campaign.name}' is already paused"}
+
             campaign.status = 'paused'
             db.session.commit()
 
@@ -10,16 +10,15 @@ import os
 import re
 import json
 import logging
-import smtplib
 from datetime import datetime
 from typing import Optional, Dict, List, Tuple
 from pathlib import Path
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 import requests
 from dotenv import load_dotenv
 
+from email_templates import build_unsubscribe_url
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +29,10 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '')
 AI_MODEL = os.getenv('AI_MODEL', 'google/gemini-2.0-flash-001')
 OPENROUTER_ENDPOINT = "https://openrouter.ai/api/v1/chat/completions"
 
+# One keep-alive session so every OpenRouter call and Telegram notification in
+# a run reuses its host's TLS connection
+ai_http = requests.Session()
+
 # Load context documents per brand
 _CONTEXT_DIR = Path(__file__).parent
 CONTEXT_DOCS = {}
@@ -235,7 +238,7 @@ class AIResponder:
 
         for attempt in range(max_retries):
             try:
-                resp = requests.post(
+                resp = ai_http.post(
                     OPENROUTER_ENDPOINT,
                     headers={
                         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
@@ -525,7 +528,7 @@ class AutoReplyScheduler:
     def process_pending_responses(self) -> int:
         """Process all unreviewed responses and send AI replies."""
         from models import Response, Lead, SentEmail, Inbox
-        from email_handler import EmailSender
+        from email_handler import EmailSender, build_references
 
         replies_sent = 0
 
@@ -767,34 +770,26 @@ class AutoReplyScheduler:
 
                     # Build threading headers so reply appears in same thread
                     reply_to_id = None
-                    ref_chain = None
                     if response.message_id:
                         reply_to_id = response.message_id
                         if not reply_to_id.startswith('<'):
                             reply_to_id = f'<{reply_to_id}>'
                     
-                    if response.references:
-                        ref_chain = " ".join(response.references.split())
-                        if reply_to_id and reply_to_id not in ref_chain:
-                            ref_chain = f'{ref_chain} {reply_to_id}'
-                    elif sent_email and sent_email.message_id:
-                        ref_chain = sent_email.message_id
-                        if reply_to_id and reply_to_id != ref_chain:
-                            ref_chain = f'{ref_chain} {reply_to_id}'
-                    elif reply_to_id:
-                        ref_chain = reply_to_id
+                    # Their References chain (or our original send) plus the message we answer
+                    thread_refs = response.references or (sent_email.message_id if sent_email else None)
+                    ref_chain = build_references(thread_refs, reply_to_id)
 
                     # BCC owner so they can see AI replies in their inbox
                     bcc_email = os.getenv('NOTIFICATION_BCC_EMAIL')
 
                     # Keep replies looking like plain personal emails (no branded template)
-                    from email_templates import build_unsubscribe_url
                     unsubscribe_url = build_unsubscribe_url(lead)
 
                     success, message_id, error = sender.send_email(
                         to_email=lead.email,
                         subject=reply_subject,
-                        body_html=reply_text.replace('\n', '<br>'),
+                        body_html=None,  # plain text only, like a personal reply
+                        body_plain=reply_text,
                         bcc=bcc_email,
                         in_reply_to=reply_to_id,
                         references=ref_chain,
@@ -913,7 +908,7 @@ def _notify_auto_reply(lead, intent, reply_text, confidence=1.0, their_message='
         if status_line:
             msg += status_line
 
-        requests.post(
+        ai_http.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
             json={"chat_id": chat_id, "text": msg, "parse_mode": "HTML"},
             timeout=10
@@ -987,7 +982,7 @@ def _notify_human_escalation(lead, reason, intent='', confidence=0, response_obj
         if suggested:
             msg += f"\n💡 <b>Suggested:</b> {suggested}"
 
-        requests.post(
+        ai_http.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
             json={"chat_id": chat_id, "text": msg, "parse_mode": "HTML"},
             timeout=10
@@ -1026,7 +1021,7 @@ def _notify_failure(lead, error_msg, step_info=''):
             msg += f"Step: {_esc(step_info)}\n"
         msg += f"\nError: {error_short}"
 
-        requests.post(
+        ai_http.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
             json={"chat_id": chat_id, "text": msg, "parse_mode": "HTML"},
             timeout=10
@@ -2,11 +2,13 @@ from flask import Flask, render_template, request, redirect, url_for, flash, jso
 from functools import wraps
 from config import Config
 from models import db, Lead, Campaign, Sequence, Inbox, SentEmail, Response, CampaignLead, CampaignInbox, SendingSchedule, Suppression
-from sqlalchemy import text
+from sqlalchemy import bindparam, exists, insert, literal, select, text
+from sqlalchemy.schema import CreateIndex
 from email_handler import EmailSender, EmailReceiver, EmailPersonalizer
 from scheduler import EmailScheduler
 from unsubscribe import verify_unsubscribe_token
 import csv
+from collections.abc import Iterator
 from io import StringIO
 from datetime import datetime, timedelta
 
@@ -84,6 +86,62 @@ def _get_inbox_window(inbox_id: int) -> tuple[int, int]:
     return start_hour, end_hour
 
 
+LEAD_CSV_COLUMNS = ('email', 'first_name', 'last_name', 'company', 'website')
+
+
+def _read_lead_csv(f) -> Iterator[tuple[str, ...]]:
+    """Yield each CSV row's stripped LEAD_CSV_COLUMNS values, by header position ('' when absent)."""
+    reader = csv.reader(f)
+    header = next(reader, [])
+    positions = [header.index(col) if col in header else None for col in LEAD_CSV_COLUMNS]
+    for row in reader:
+        yield tuple(row[i].strip() if i is not None and i < len(row) else '' for i in positions)
+
+
+def _import_lead_csv(f, source: str) -> tuple[int, int]:
+    """Insert the new leads from a lead CSV; returns (imported, skipped).
+
+    Rows without an email, repeats within the file and emails already in the CRM
+    (compared case-insensitively) are skipped.
+    """
+    new_leads = {}  # lowercased email -> row; first occurrence wins
+    skipped = 0
+
+    for email, first_name, last_name, company, website in _read_lead_csv(f):
+        if not email:
+            skipped += 1
+            continue
+
+        # Duplicate of an earlier row in this file (emails compare case-insensitively)
+        key = email.lower()
+        if key in new_leads:
+            skipped += 1
+            continue
+
+        new_leads[key] = {
+            'email': email,
+            'first_name': first_name,
+            'last_name': last_name,
+            'company': company,
+            'website': website,
+            'source': source,
+        }
+
+    # Drop those already in the CRM, a chunk of emails per query (served by ix_leads_email_lower)
+    emails = list(new_leads)
+    for i in range(0, len(emails), 500):
+        chunk = emails[i:i + 500]
+        for (key,) in db.session.query(db.func.lower(Lead.email)).filter(db.func.lower(Lead.email).in_(chunk)):
+            if new_leads.pop(key, None) is not None:
+                skipped += 1
+
+    # One bulk INSERT for the whole file rather than a flush per lead
+    if new_leads:
+        db.session.execute(insert(Lead), list(new_leads.values()))
+    db.session.commit()
+    return len(new_leads), skipped
+
+
 # Authentication disabled for local development
 # To enable, uncomment the code below
 #
@@ -128,9 +186,9 @@ def unsubscribe(token):
 
     lead.status = 'not_interested'
 
-    campaign_leads = CampaignLead.query.filter_by(lead_id=lead.id, status='active').all()
-    for cl in campaign_leads:
-        cl.status = 'completed'
+    CampaignLead.query.filter_by(lead_id=lead.id, status='active').update(
+        {'status': 'completed'}, synchronize_session=False
+    )
 
     db.session.commit()
 
@@ -402,37 +460,8 @@ def import_leads():
         try:
             # Read CSV
             stream = StringIO(file.stream.read().decode('utf-8'))
-            csv_reader = csv.DictReader(stream)
-
-            imported = 0
-            skipped = 0
-
-            for row in csv_reader:
-                email = row.get('email', '').strip()
-
-                if not email:
-                    skipped += 1
-                    continue
-
-                # Check if exists
-                existing = Lead.query.filter_by(email=email).first()
-                if existing:
-                    skipped += 1
-                    continue
-
-                lead = Lead(
-                    email=email,
-                    first_name=row.get('first_name', '').strip(),
-                    last_name=row.get('last_name', '').strip(),
-                    company=row.get('company', '').strip(),
-                    website=row.get('website', '').strip(),
-                    source='csv_import'
-                )
 
-                db.session.add(lead)
-                imported += 1
-
-            db.session.commit()
+            imported, skipped = _import_lead_csv(stream, 'csv_import')
 
             flash(f'Imported {imported} leads, skipped {skipped}', 'success')
             return redirect(url_for('leads'))
@@ -588,23 +617,22 @@ def add_leads_to_campaign(campaign_id):
     campaign = Campaign.query.get_or_404(campaign_id)
 
     if request.method == 'POST':
-        lead_ids = request.form.getlist('lead_ids')
+        lead_ids = {int(lead_id) for lead_id in request.form.getlist('lead_ids')}
 
         added = 0
-        for lead_id in lead_ids:
-            # Check if already in campaign
-            existing = CampaignLead.query.filter_by(
-                campaign_id=campaign_id,
-                lead_id=int(lead_id)
-            ).first()
-
-            if not existing:
-                campaign_lead = CampaignLead(
-                    campaign_id=campaign_id,
-                    lead_id=int(lead_id)
-                )
-                db.session.add(campaign_lead)
-                added += 1
+        if lead_ids:
+            # One INSERT ... SELECT; NOT EXISTS lets the database skip leads already in the campaign
+            already_in = exists().where(
+                CampaignLead.campaign_id == campaign_id,
+                CampaignLead.lead_id == Lead.id
+            )
+            new_links = select(
+                literal(campaign_id), Lead.id, literal('active'), literal(datetime.utcnow())
+            ).where(Lead.id.in_(lead_ids), ~already_in)
+            result = db.session.execute(
+                insert(CampaignLead).from_select(['campaign_id', 'lead_id', 'status', 'added_at'], new_links)
+            )
+            added = result.rowcount
 
         db.session.commit()
 
@@ -1205,34 +1233,62 @@ def create_tables():
                     inbox.max_per_hour
                 )
         _ensure_response_columns()
+        _ensure_indexes()
+
+
+def _ensure_indexes() -> None:
+    """Create indexes declared on the models that an existing database is missing."""
+    # IF NOT EXISTS rather than checkfirst: reflection can't see expression
+    # indexes such as lower(email), so checkfirst would re-create them
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# Columns added after the first deploy: {table: {column: DDL type}}
+_LIGHTWEIGHT_COLUMNS = {
+    "responses": {
+        "assigned_to": "TEXT",
+        "label": "TEXT",
+        "notified": "BOOLEAN DEFAULT 0",
+    },
+    # Email verification columns on leads table
+    "leads": {
+        "email_verified": "BOOLEAN DEFAULT 0",
+        "email_verification_status": "TEXT",
+        "email_verified_at": "DATETIME",
+        "personal_deadline": "TEXT",
+    },
+    "campaigns": {
+        "last_rotation_inbox_id": "INTEGER",
+    },
+}
+_columns_checked = False
 
 
 def _ensure_response_columns() -> None:
     """Add missing columns to responses table for lightweight migrations."""
-    columns = db.session.execute(text("PRAGMA table_info(responses)")).fetchall()
-    existing = {col[1] for col in columns}
-
-    if "assigned_to" not in existing:
-        db.session.execute(text("ALTER TABLE responses ADD COLUMN assigned_to TEXT"))
-    if "label" not in existing:
-        db.session.execute(text("ALTER TABLE responses ADD COLUMN label TEXT"))
-    if "notified" not in existing:
-        db.session.execute(text("ALTER TABLE responses ADD COLUMN notified BOOLEAN DEFAULT 0"))
-    db.session.commit()
-
-    # Email verification columns on leads table
-    lead_cols = db.session.execute(text("PRAGMA table_info(leads)")).fetchall()
-    lead_existing = {col[1] for col in lead_cols}
-
-    if "email_verified" not in lead_existing:
-        db.session.execute(text("ALTER TABLE leads ADD COLUMN email_verified BOOLEAN DEFAULT 0"))
-    if "email_verification_status" not in lead_existing:
-        db.session.execute(text("ALTER TABLE leads ADD COLUMN email_verification_status TEXT"))
-    if "email_verified_at" not in lead_existing:
-        db.session.execute(text("ALTER TABLE leads ADD COLUMN email_verified_at DATETIME"))
-    if "personal_deadline" not in lead_existing:
-        db.session.execute(text("ALTER TABLE leads ADD COLUMN personal_deadline TEXT"))
+    global _columns_checked
+    # Several entry points call this at import; one check per process is enough
+    if _columns_checked:
+        return
+
+    # One round trip for every table instead of a PRAGMA per table
+    existing = set(db.session.execute(
+        text(
+            "SELECT m.name, p.name FROM sqlite_master m, pragma_table_info(m.name) p "
+            "WHERE m.type = 'table' AND m.name IN :tables"
+        ).bindparams(bindparam("tables", expanding=True)),
+        {"tables": list(_LIGHTWEIGHT_COLUMNS)},
+    ).fetchall())
+
+    for table, columns in _LIGHTWEIGHT_COLUMNS.items():
+        for column, ddl in columns.items():
+            if (table, column) not in existing:
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
     db.session.commit()
+    _columns_checked = True
 
 
 if __name__ == '__main__':
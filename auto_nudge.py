@@ -40,7 +40,7 @@ logger = logging.getLogger(__name__)
 
 from app import app, _ensure_response_columns
 from models import db, Lead, Response, SentEmail, CampaignLead, Campaign, Sequence, Inbox
-from email_handler import EmailSender
+from email_handler import EmailSender, build_references
 from email_templates import build_unsubscribe_url
 from config import Config
 
@@ -116,7 +116,7 @@ def get_nudge_candidates():
             # OOO: skip only if return date hasn't passed yet
             if 'out_of_office' in notes_lower:
                 ooo_return = _parse_ooo_return(last_response.notes)
-                if ooo_return and ooo_return > datetime.utcnow().date():
+                if ooo_return and ooo_return > now.date():
                     continue
                 # Return date has passed (or wasn't set) — they're back, eligible for nudge
 
@@ -288,7 +288,6 @@ def send_nudge(lead, nudge_text, dry_run=False):
 
     # Threading headers
     reply_to_id = None
-    ref_chain = None
 
     last_response = Response.query.filter_by(
         lead_id=lead.id
@@ -303,12 +302,7 @@ def send_nudge(lead, nudge_text, dry_run=False):
         if not reply_to_id.startswith('<'):
             reply_to_id = f'<{reply_to_id}>'
 
-    if last_sent and last_sent.message_id:
-        ref_chain = last_sent.message_id
-        if reply_to_id and reply_to_id != ref_chain:
-            ref_chain = f'{ref_chain} {reply_to_id}'
-    elif reply_to_id:
-        ref_chain = reply_to_id
+    ref_chain = build_references(last_sent.message_id if last_sent else None, reply_to_id)
 
     # Send
     unsubscribe_url = build_unsubscribe_url(lead)
@@ -318,7 +312,8 @@ def send_nudge(lead, nudge_text, dry_run=False):
     success, message_id, error = sender.send_email(
         to_email=lead.email,
         subject=subject,
-        body_html=nudge_text.replace('\n', '<br>'),
+        body_html=None,  # plain text only, like a personal reply
+        body_plain=nudge_text,
         bcc=bcc_email,
         in_reply_to=reply_to_id,
         references=ref_chain,
@@ -348,7 +343,7 @@ def send_nudge(lead, nudge_text, dry_run=False):
 def notify_nudge_sent(lead, nudge_text, nudge_count, days_since):
     """Send Telegram notification about the nudge."""
     try:
-        import requests
+        from ai_responder import ai_http
         token = os.getenv('TELEGRAM_BOT_TOKEN')
         chat_id = os.getenv('TELEGRAM_CHAT_ID')
         if not token or not chat_id:
@@ -373,7 +368,7 @@ def notify_nudge_sent(lead, nudge_text, nudge_count, days_since):
             f"\"{preview}{'...' if len(nudge_text) > 200 else ''}\""
         )
 
-        requests.post(
+        ai_http.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
             json={"chat_id": chat_id, "text": msg, "parse_mode": "HTML"},
             timeout=10
@@ -387,7 +382,7 @@ def notify_nudge_summary(sent_count, candidate_count):
     if sent_count == 0:
         return
     try:
-        import requests
+        from ai_responder import ai_http
         token = os.getenv('TELEGRAM_BOT_TOKEN')
         chat_id = os.getenv('TELEGRAM_CHAT_ID')
         if not token or not chat_id:
@@ -399,7 +394,7 @@ def notify_nudge_summary(sent_count, candidate_count):
             f"Remaining: {candidate_count - sent_count} (cap or filtered)"
         )
 
-        requests.post(
+        ai_http.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
             json={"chat_id": chat_id, "text": msg, "parse_mode": "HTML"},
             timeout=10
@@ -3,7 +3,7 @@
 Bounce Handler - Automatic Email Bounce Detection & Management
 
 Detects bounced emails via:
-1. IMAP bounce folder monitoring
+1. IMAP bounce folder monitoring (RFC 3464 delivery-status reports first)
 2. Response content analysis (AI-powered)
 3. SMTP delivery failure tracking
 
@@ -15,15 +15,35 @@ Actions taken:
 """
 
 import re
+import time
+import imaplib
 import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from email.parser import BytesHeaderParser
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_FETCH_ID_RE = re.compile(rb'^(\d+) \(')
+_FETCH_SECTION_RE = re.compile(rb'BODY\[([^\]]*)\]')
+
+# Header-only parser for the bounce reject path; never walks MIME bodies
+_HEADER_PARSER = BytesHeaderParser()
+
+
+@lru_cache(maxsize=None)
+def _compile_patterns(patterns: Tuple[str, ...]) -> Tuple[re.Pattern, ...]:
+    """Compile a pattern list once per process; every BounceDetector shares the result"""
+    return tuple(re.compile(p, re.IGNORECASE) for p in patterns)
+
+
+# Long-lived IMAP connections for watch mode, keyed by (host, mailbox address)
+_IMAP_POOL: Dict[Tuple[str, str], imaplib.IMAP4_SSL] = {}
+
 
 class BounceType(Enum):
     HARD = "hard"           # Permanent failure (bad address, domain doesn't exist)
@@ -45,6 +65,14 @@ class BounceRecord:
     should_retry: bool = False
 
 
+# Which bounce wins when one address bounced several times in a scan
+_BOUNCE_SEVERITY = {
+    BounceType.UNKNOWN: 0,
+    BounceType.SOFT: 1,
+    BounceType.HARD: 2,
+    BounceType.COMPLAINT: 3,
+}
+
 class BounceDetector:
     """Detects bounced emails from various sources"""
     
@@ -60,6 +88,30 @@ class BounceDetector:
         # Note: noreply/no-reply removed — too broad, catches legitimate auto-replies
     ]
     
+    # Common bounce indicators in subjects
+    BOUNCE_SUBJECTS = [
+        'delivery status notification',
+        'delivery failure',
+        'undeliverable',
+        'bounce',
+        'mail delivery failed',
+        'returned mail',
+        'failed delivery',
+    ]
+    
+    # Patterns for the original recipient inside a bounce body, most specific first
+    RECIPIENT_PATTERNS = [
+        r'original-recipient:\s*[^;]*;?\s*<?([^>\s]+@[^>\s]+)>?',
+        r'final-recipient:\s*[^;]*;?\s*<?([^>\s]+@[^>\s]+)>?',
+        r'diagnostic-code:[^\n]*\n[^\n]*<?([^>\s]+@[^>\s]+)>?',
+        r'to:\s*<?([^>\s]+@[^>\s]+)>?',
+        r'recipient:\s*<?([^>\s]+@[^>\s]+)>?',
+        r'[<\s]([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})[>\s]',
+    ]
+    
+    # Addresses that show up in bounce bodies but are never the bounced recipient
+    NON_RECIPIENT_MARKERS = ('mailer-daemon', 'postmaster', 'noreply')
+    
     # Hard bounce patterns (permanent failures)
     HARD_BOUNCE_PATTERNS = [
         r'user unknown',
@@ -115,9 +167,10 @@ class BounceDetector:
     
     def __init__(self, ai_enabled: bool = True):
         self.ai_enabled = ai_enabled
-        self.hard_patterns = [re.compile(p, re.IGNORECASE) for p in self.HARD_BOUNCE_PATTERNS]
-        self.soft_patterns = [re.compile(p, re.IGNORECASE) for p in self.SOFT_BOUNCE_PATTERNS]
-        self.complaint_patterns = [re.compile(p, re.IGNORECASE) for p in self.COMPLAINT_PATTERNS]
+        self.hard_patterns = _compile_patterns(tuple(self.HARD_BOUNCE_PATTERNS))
+        self.soft_patterns = _compile_patterns(tuple(self.SOFT_BOUNCE_PATTERNS))
+        self.complaint_patterns = _compile_patterns(tuple(self.COMPLAINT_PATTERNS))
+        self.recipient_patterns = _compile_patterns(tuple(self.RECIPIENT_PATTERNS))
     
     def is_bounce_email(self, from_email: str, subject: str = "") -> bool:
         """Check if an email is a bounce message based on sender/subject"""
@@ -130,21 +183,27 @@ class BounceDetector:
                 return True
         
         # Check subject for common bounce indicators
-        bounce_subjects = [
-            'delivery status notification',
-            'delivery failure',
-            'undeliverable',
-            'bounce',
-            'mail delivery failed',
-            'returned mail',
-            'failed delivery'
-        ]
-        for indicator in bounce_subjects:
+        for indicator in self.BOUNCE_SUBJECTS:
             if indicator in subject_lower:
                 return True
         
         return False
     
+    def imap_search_criteria(self, since_date: str) -> str:
+        """IMAP SEARCH criteria matching recent messages that look like bounces.
+
+        Mirrors is_bounce_email server-side (FROM/SUBJECT are substring matches),
+        so only candidate bounces are returned and fetched.
+        """
+        terms = [f'FROM "{s}"' for s in self.BOUNCE_SENDERS]
+        terms += [f'SUBJECT "{s}"' for s in self.BOUNCE_SUBJECTS]
+        # RFC 3464 DSNs from any sender: multipart/report; report-type=delivery-status
+        terms.append('HEADER Content-Type "delivery-status"')
+        criteria = terms[-1]
+        for term in reversed(terms[:-1]):
+            criteria = f'OR {term} ({criteria})' if criteria.startswith('OR ') else f'OR {term} {criteria}'
+        return f'SINCE {since_date} ({criteria})'
+    
     def detect_bounce_type(self, email_body: str, subject: str = "") -> Tuple[BounceType, str]:
         """Analyze bounce email content to determine bounce type and reason"""
         text = f"{subject}\n{email_body}".lower()
@@ -178,131 +237,393 @@ class BounceDetector:
     
     def extract_bounced_email(self, email_body: str) -> Optional[str]:
         """Extract the original recipient email from bounce message"""
-        # Common patterns for original recipient
-        patterns = [
-            r'original-recipient:\s*[^;]*;?\s*<?([^>\s]+@[^>\s]+)>?',
-            r'final-recipient:\s*[^;]*;?\s*<?([^>\s]+@[^>\s]+)>?',
-            r'diagnostic-code:[^\n]*\n[^\n]*<?([^>\s]+@[^>\s]+)>?',
-            r'to:\s*<?([^>\s]+@[^>\s]+)>?',
-            r'recipient:\s*<?([^>\s]+@[^>\s]+)>?',
-            r'[<\s]([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})[>\s]',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, email_body, re.IGNORECASE)
-            for match in matches:
+        for pattern in self.recipient_patterns:
+            for match in pattern.findall(email_body):
                 email = match.strip().lower()
                 # Filter out common non-bounced addresses
-                if email and not any(x in email for x in ['mailer-daemon', 'postmaster', 'noreply']):
+                if email and not any(x in email for x in self.NON_RECIPIENT_MARKERS):
                     return email
         
         return None
 
 
+def _group_fetch_sections(fetch_data) -> Dict[bytes, Dict[str, bytes]]:
+    """Group a multi-message IMAP FETCH response into {msg_id: {section: bytes}}.
+
+    imaplib returns one (prefix, literal) tuple per literal plus bare bytes for
+    the rest, e.g. (b'3 (BODYSTRUCTURE (...) BODY[HEADER.FIELDS (FROM)] {52}', b'...'),
+    b')'. A fragment starting with a sequence number opens a new message.
+    Sections are keyed by their first word (``HEADER.FIELDS``, ``TEXT``, ``1.2``);
+    a BODYSTRUCTURE list is kept unparsed under ``BODYSTRUCTURE``.
+    """
+    grouped: Dict[bytes, Dict[str, bytes]] = {}
+    current = None
+    for item in fetch_data or []:
+        if isinstance(item, tuple) and len(item) >= 2:
+            fragment, literal = item[0], item[1]
+        elif isinstance(item, bytes):
+            fragment, literal = item, None
+        else:
+            continue
+        id_match = _FETCH_ID_RE.match(fragment)
+        if id_match:
+            current = grouped.setdefault(id_match.group(1), {})
+        if current is None:
+            continue
+        structure_at = fragment.find(b'BODYSTRUCTURE (')
+        if structure_at != -1:
+            current['BODYSTRUCTURE'] = fragment[structure_at + len(b'BODYSTRUCTURE '):]
+        if literal is not None:
+            section_match = _FETCH_SECTION_RE.search(fragment)
+            if section_match:
+                section = section_match.group(1).decode('ascii', 'ignore').split(' ', 1)[0]
+                current[section.upper()] = literal
+    return grouped
+
+
+def _parse_imap_list(data: bytes):
+    """Parse one parenthesized IMAP list (e.g. a BODYSTRUCTURE) into nested Python lists.
+
+    Quoted strings and atoms become str, NIL becomes None. Literals ({n}) are
+    not supported and raise ValueError so callers can fall back to a full fetch.
+    """
+    stack, current, i = [], None, 0
+    while i < len(data):
+        ch = data[i:i + 1]
+        if ch == b'(':
+            new = []
+            if current is not None:
+                current.append(new)
+                stack.append(current)
+            current = new
+            i += 1
+        elif ch == b')':
+            if not stack:
+                return current
+            current = stack.pop()
+            i += 1
+        elif ch == b' ':
+            i += 1
+        elif ch == b'"':
+            j, buf = i + 1, bytearray()
+            while data[j:j + 1] != b'"':
+                if j >= len(data):
+                    raise ValueError("unterminated quoted string")
+                if data[j:j + 1] == b'\\':
+                    j += 1
+                buf += data[j:j + 1]
+                j += 1
+            current.append(buf.decode('utf-8', 'ignore'))
+            i = j + 1
+        elif ch == b'{':
+            raise ValueError("literal inside BODYSTRUCTURE")
+        else:
+            j = i
+            while j < len(data) and data[j:j + 1] not in (b' ', b'(', b')'):
+                j += 1
+            atom = data[i:j].decode('ascii', 'ignore')
+            if current is None:
+                raise ValueError("BODYSTRUCTURE must start with '('")
+            current.append(None if atom.upper() == 'NIL' else atom)
+            i = j
+    raise ValueError("unbalanced BODYSTRUCTURE")
+
+
+def _find_part(structure, maintype: str, subtype: str, part_number: str = '') -> Optional[Tuple[str, str, Optional[str]]]:
+    """Return (part number, transfer encoding, charset) of the first maintype/subtype part."""
+    if not structure:
+        return None
+    if isinstance(structure[0], list):
+        # multipart: leading sub-part lists, then the subtype and extension data
+        for index, child in enumerate(structure, start=1):
+            if not isinstance(child, list):
+                break
+            found = _find_part(child, maintype, subtype, f"{part_number}.{index}" if part_number else str(index))
+            if found:
+                return found
+        return None
+    if len(structure) > 5 and str(structure[0]).lower() == maintype and str(structure[1]).lower() == subtype:
+        params = structure[2] or []
+        charset = dict(zip((str(k).lower() for k in params[::2]), params[1::2])).get('charset')
+        return part_number or '1', structure[5] or '7bit', charset
+    return None
+
+
+def _find_text_plain_part(structure, part_number: str = '') -> Optional[Tuple[str, str, Optional[str]]]:
+    """Return (part number, transfer encoding, charset) of the first text/plain part."""
+    return _find_part(structure, 'text', 'plain', part_number)
+
+
+def _parse_delivery_status(text: str) -> List[Dict[str, str]]:
+    """Parse an RFC 3464 message/delivery-status body into per-recipient field dicts.
+
+    The body is a per-message block followed by one block per recipient, each
+    a set of header-style fields separated by blank lines. Field names are
+    lowercased; the address type prefix ("rfc822;") is stripped from recipients.
+    """
+    recipients = []
+    for block in re.split(r'\r?\n\s*\r?\n', text.strip()):
+        fields: Dict[str, str] = {}
+        name = None
+        for line in block.splitlines():
+            if line[:1] in (' ', '\t') and name:
+                fields[name] += ' ' + line.strip()
+            elif ':' in line:
+                name, value = line.split(':', 1)
+                name = name.strip().lower()
+                fields[name] = value.strip()
+        recipient = fields.get('original-recipient') or fields.get('final-recipient')
+        if not recipient:
+            continue
+        fields['recipient'] = recipient.split(';', 1)[-1].strip().strip('<>').lower()
+        recipients.append(fields)
+    return recipients
+
+
+def _decode_part(raw: bytes, encoding: str, charset: Optional[str]) -> str:
+    """Undo a MIME Content-Transfer-Encoding and decode to text"""
+    import base64
+    import binascii
+    import quopri
+    
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        try:
+            raw = base64.b64decode(raw)
+        except (binascii.Error, ValueError):
+            pass
+    elif encoding == 'quoted-printable':
+        raw = quopri.decodestring(raw)
+    try:
+        return raw.decode(charset or 'utf-8', errors='ignore')
+    except LookupError:
+        return raw.decode('utf-8', errors='ignore')
+
+
 class BounceProcessor:
     """Processes detected bounces and updates database"""
     
-    def __init__(self, db_session, detector: Optional[BounceDetector] = None):
+    # Messages requested per IMAP FETCH command
+    FETCH_BATCH_SIZE = 100
+    
+    # Headers needed to decide whether a message is a bounce
+    HEADER_FIELDS = 'FROM SUBJECT MESSAGE-ID'
+    
+    # Values per SQL IN (...) list, well under SQLite's 999 bound-parameter limit
+    IN_CLAUSE_CHUNK_SIZE = 500
+    
+    # Check INBOX (many bounces land here) plus spam/junk folders
+    BOUNCE_FOLDERS = ['INBOX', 'Spam', 'Junk', '[Gmail]/Spam', 'Quarantine', 'Bounces', 'INBOX.Spam', 'INBOX.Junk']
+    
+    def __init__(self, db_session, detector: Optional[BounceDetector] = None, keep_alive: bool = False):
         # Accept either the Flask-SQLAlchemy db object or a Session/scoped_session.
         # GitHub Actions passes db.session here, so normalize once and use it directly.
         self.session = getattr(db_session, 'session', db_session)
         self.detector = detector or BounceDetector()
+        # keep_alive reuses pooled connections (watch mode) instead of connect/logout per scan
+        self.keep_alive = keep_alive
     
-    def process_bounce_folder(self, inbox) -> List[BounceRecord]:
+    def process_bounce_folder(self, inbox, folders: Optional[List[str]] = None) -> List[BounceRecord]:
         """Check bounce/quarantine folder for new bounces"""
-        import imaplib
-        import email
-        from email.header import decode_header
-        
         bounces_found = []
+        mail = None
         
         try:
-            mail = imaplib.IMAP4_SSL(inbox.imap_host, inbox.imap_port, timeout=30)
-            mail.login(inbox.username, inbox.password)
+            if self.keep_alive:
+                mail = get_imap(inbox)
+            else:
+                mail = imaplib.IMAP4_SSL(inbox.imap_host, inbox.imap_port, timeout=30)
+                mail.login(inbox.username, inbox.password)
             
-            # Check INBOX (many bounces land here) plus spam/junk folders
-            folders_to_check = ['INBOX', 'Spam', 'Junk', '[Gmail]/Spam', 'Quarantine', 'Bounces', 'INBOX.Spam', 'INBOX.Junk']
+            since_date = (datetime.utcnow() - timedelta(days=7)).strftime('%d-%b-%Y')
+            search_criteria = self.detector.imap_search_criteria(since_date)
             
-            for folder in folders_to_check:
+            for folder in folders or self.BOUNCE_FOLDERS:
                 try:
-                    status, _ = mail.select(folder)
+                    status, data = mail.select(folder)
                     if status != 'OK':
+                        # Missing folders answer NO without raising; log like any folder error
+                        logger.debug(f"Could not check folder {folder}: {data}")
                         continue
                     
-                    # Search for recent bounces (last 7 days)
-                    since_date = (datetime.utcnow() - timedelta(days=7)).strftime('%d-%b-%Y')
-                    status, messages = mail.search(None, f'SINCE {since_date}')
+                    # Search for recent bounces (last 7 days), filtered server-side
+                    try:
+                        status, messages = mail.search(None, search_criteria)
+                    except imaplib.IMAP4.error:
+                        status = None
+                    if status != 'OK':
+                        # Server rejected the OR filter (BAD raises, NO doesn't);
+                        # scan everything since the date
+                        status, messages = mail.search(None, f'SINCE {since_date}')
                     
                     if status != 'OK':
                         continue
                     
                     message_ids = messages[0].split()
-                    
-                    for msg_id in message_ids:
-                        try:
-                            status, msg_data = mail.fetch(msg_id, '(RFC822)')
-                            if status != 'OK':
-                                continue
-                            
-                            email_msg = email.message_from_bytes(msg_data[0][1])
-                            
-                            from_addr = email_msg.get('From', '')
-                            subject = email_msg.get('Subject', '')
-                            
-                            # Check if this is a bounce
-                            if not self.detector.is_bounce_email(from_addr, subject):
-                                continue
-                            
-                            # Extract body
-                            body = ""
-                            if email_msg.is_multipart():
-                                for part in email_msg.walk():
-                                    content_type = part.get_content_type()
-                                    if content_type == 'text/plain':
-                                        try:
-                                            body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                                            break
-                                        except:
-                                            pass
-                            else:
-                                try:
-                                    body = email_msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-                                except:
-                                    body = str(email_msg.get_payload())
-                            
-                            # Detect bounce type
-                            bounce_type, reason = self.detector.detect_bounce_type(body, subject)
-                            
-                            # Extract bounced email address
-                            bounced_email = self.detector.extract_bounced_email(body)
-                            
-                            if bounced_email:
-                                bounce = BounceRecord(
-                                    email=bounced_email,
-                                    bounce_type=bounce_type,
-                                    reason=reason,
-                                    detected_at=datetime.utcnow(),
-                                    message_id=email_msg.get('Message-ID', ''),
-                                    original_subject=subject,
-                                    raw_bounce_body=body[:1000]  # Truncate for storage
-                                )
-                                bounces_found.append(bounce)
-                                
-                        except Exception as e:
-                            logger.warning(f"Error processing message {msg_id}: {e}")
+
+                    # One FETCH per batch for headers + structure only. BODY.PEEK
+                    # leaves \Seen untouched; bodies are fetched for bounces alone.
+                    for batch_start in range(0, len(message_ids), self.FETCH_BATCH_SIZE):
+                        batch = message_ids[batch_start:batch_start + self.FETCH_BATCH_SIZE]
+                        status, msg_data = mail.fetch(b','.join(batch), f'(BODY.PEEK[HEADER.FIELDS ({self.HEADER_FIELDS})] BODYSTRUCTURE)')
+                        if status != 'OK':
                             continue
+
+                        for msg_id, sections in _group_fetch_sections(msg_data).items():
+                            try:
+                                headers = _HEADER_PARSER.parsebytes(sections.get('HEADER.FIELDS', b''))
+                                subject = headers.get('Subject', '')
+                                message_id = headers.get('Message-ID', '')
+                                structure = self._parse_structure(sections.get('BODYSTRUCTURE'))
+                                
+                                # Standard DSNs carry the recipient and status in a
+                                # message/delivery-status part; no body regex needed
+                                dsn_part = _find_part(structure, 'message', 'delivery-status')
+                                if dsn_part:
+                                    dsn_bounces = self._fetch_dsn_records(mail, msg_id, dsn_part, subject, message_id)
+                                    if dsn_bounces is not None:
+                                        bounces_found.extend(dsn_bounces)
+                                        continue
+                                
+                                # Check if this is a bounce
+                                if not self.detector.is_bounce_email(headers.get('From', ''), subject):
+                                    continue
+                                
+                                body = self._fetch_text_body(mail, msg_id, structure)
+                                bounce = self._build_bounce_record(body, subject, message_id)
+                                if bounce:
+                                    bounces_found.append(bounce)
+                            except Exception as e:
+                                logger.warning(f"Error processing message {msg_id}: {e}")
+                                continue
                     
                 except Exception as e:
                     logger.debug(f"Could not check folder {folder}: {e}")
                     continue
             
-            mail.logout()
+            if not self.keep_alive:
+                mail.logout()
             
         except Exception as e:
             logger.error(f"Error checking bounce folders: {e}")
+            if self.keep_alive:
+                _drop_imap(inbox)
         
         return bounces_found
     
+    def _parse_structure(self, structure: Optional[bytes]):
+        """Parse a raw BODYSTRUCTURE, or None if absent or unparseable"""
+        if not structure:
+            return None
+        try:
+            return _parse_imap_list(structure)
+        except (ValueError, IndexError, AttributeError, TypeError):
+            return None
+    
+    def _fetch_dsn_records(self, mail, msg_id: bytes, part, subject: str, message_id: str = '') -> Optional[List[BounceRecord]]:
+        """Fetch a message/delivery-status part and turn its failed recipients into bounces
+        
+        Returns None when the part can't be fetched or names no recipient, so the
+        caller falls back to scanning the human-readable text.
+        """
+        part_number, encoding, charset = part
+        status, data = mail.fetch(msg_id, f'(BODY.PEEK[{part_number}])')
+        raw = _group_fetch_sections(data).get(msg_id, {}).get(part_number) if status == 'OK' else None
+        if raw is None:
+            return None
+        
+        text = _decode_part(raw, encoding, charset)
+        recipients = _parse_delivery_status(text)
+        if not recipients:
+            return None
+        
+        bounces = []
+        for fields in recipients:
+            # Only failed (5.x.x) and delayed (4.x.x) recipients are bounces
+            action = fields.get('action', '').lower()
+            if action and action not in ('failed', 'delayed'):
+                continue
+            code = fields.get('status', '')
+            diagnostic = fields.get('diagnostic-code', '')
+            if code.startswith('5'):
+                bounce_type, reason = BounceType.HARD, f"Hard bounce: {code} {diagnostic}".strip()
+            elif code.startswith('4'):
+                bounce_type, reason = BounceType.SOFT, f"Soft bounce: {code} {diagnostic}".strip()
+            else:
+                bounce_type, reason = self.detector.detect_bounce_type(diagnostic, subject)
+            bounces.append(BounceRecord(
+                email=fields['recipient'],
+                bounce_type=bounce_type,
+                reason=reason,
+                detected_at=datetime.utcnow(),
+                message_id=message_id,
+                original_subject=subject,
+                raw_bounce_body=text[:1000],
+                should_retry=(bounce_type == BounceType.SOFT),
+            ))
+        return bounces
+    
+    def _fetch_text_body(self, mail, msg_id: bytes, structure) -> str:
+        """Fetch only the first text/plain part named by BODYSTRUCTURE, else the whole message"""
+        import email
+        
+        try:
+            part = _find_text_plain_part(structure)
+        except (IndexError, AttributeError, TypeError):
+            part = None
+        
+        if part:
+            part_number, encoding, charset = part
+            status, data = mail.fetch(msg_id, f'(BODY.PEEK[{part_number}])')
+            raw = _group_fetch_sections(data).get(msg_id, {}).get(part_number) if status == 'OK' else None
+            if raw is not None:
+                return _decode_part(raw, encoding, charset)
+        
+        status, data = mail.fetch(msg_id, '(BODY.PEEK[])')
+        if status != 'OK':
+            return ""
+        raw = _group_fetch_sections(data).get(msg_id, {}).get('', b'')
+        return self._extract_text_body(email.message_from_bytes(raw))
+    
+    def _extract_text_body(self, email_msg) -> str:
+        """Return the first text/plain part of a parsed message"""
+        body = ""
+        if email_msg.is_multipart():
+            for part in email_msg.walk():
+                content_type = part.get_content_type()
+                if content_type == 'text/plain':
+                    try:
+                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                        break
+                    except:
+                        pass
+        else:
+            try:
+                body = email_msg.get_payload(decode=True).decode('utf-8', errors='ignore')
+            except:
+                body = str(email_msg.get_payload())
+        return body
+    
+    def _build_bounce_record(self, body: str, subject: str, message_id: str = '') -> Optional[BounceRecord]:
+        """Classify a bounce body; None if no bounced recipient can be found"""
+        # Detect bounce type
+        bounce_type, reason = self.detector.detect_bounce_type(body, subject)
+        
+        # Extract bounced email address
+        bounced_email = self.detector.extract_bounced_email(body)
+        if not bounced_email:
+            return None
+        
+        return BounceRecord(
+            email=bounced_email,
+            bounce_type=bounce_type,
+            reason=reason,
+            detected_at=datetime.utcnow(),
+            message_id=message_id,
+            original_subject=subject,
+            raw_bounce_body=body[:1000]  # Truncate for storage
+        )
+    
     def process_smtp_failure(self, email: str, error_message: str) -> BounceRecord:
         """Process an SMTP delivery failure"""
         bounce_type, reason = self.detector.detect_bounce_type(error_message)
@@ -315,54 +636,72 @@ class BounceProcessor:
             should_retry=(bounce_type == BounceType.SOFT)
         )
     
-    def update_lead_status(self, bounce: BounceRecord) -> bool:
-        """Update lead status based on bounce"""
-        from models import Lead, CampaignLead
+    def load_leads_by_email(self, emails) -> Dict:
+        """Fetch the leads for a set of emails with chunked IN queries, keyed by email"""
+        from models import Lead
+        
+        emails = sorted({e.lower() for e in emails if e})
+        leads_by_email = {}
+        for start in range(0, len(emails), self.IN_CLAUSE_CHUNK_SIZE):
+            chunk = emails[start:start + self.IN_CLAUSE_CHUNK_SIZE]
+            for lead in Lead.query.filter(Lead.email.in_(chunk)).all():
+                leads_by_email[lead.email.lower()] = lead
+        return leads_by_email
+    
+    def _apply_bounce(self, lead, bounce: BounceRecord) -> bool:
+        """Apply a bounce to a lead in the session. Returns True if its campaigns should stop."""
+        if bounce.bounce_type == BounceType.HARD:
+            lead.status = 'bounced'
+            lead.email_verification_status = f"Hard bounce: {bounce.reason}"
+            logger.info(f"Marked lead as bounced (hard): {bounce.email}")
+            return True
+        
+        if bounce.bounce_type == BounceType.COMPLAINT:
+            lead.status = 'complained'
+            lead.email_verification_status = f"Spam complaint: {bounce.reason}"
+            logger.info(f"Marked lead as complained: {bounce.email}")
+            return True
+        
+        if bounce.bounce_type == BounceType.SOFT:
+            # Don't change status yet, but track the bounce
+            lead.email_verification_status = f"Soft bounce ({datetime.utcnow().strftime('%Y-%m-%d')}): {bounce.reason}"
+            logger.info(f"Recorded soft bounce for: {bounce.email}")
+        
+        return False
+    
+    def _stop_campaigns_for_leads(self, lead_ids) -> int:
+        """Stop every active campaign enrollment for the given leads with chunked bulk UPDATEs"""
+        from models import CampaignLead
+        
+        lead_ids = sorted(set(lead_ids))
+        stopped = 0
+        for start in range(0, len(lead_ids), self.IN_CLAUSE_CHUNK_SIZE):
+            chunk = lead_ids[start:start + self.IN_CLAUSE_CHUNK_SIZE]
+            stopped += CampaignLead.query.filter(
+                CampaignLead.lead_id.in_(chunk),
+                CampaignLead.status == 'active'
+            ).update({'status': 'stopped'}, synchronize_session=False)
+        return stopped
+    
+    def update_lead_status(self, bounce: BounceRecord, lead=None) -> bool:
+        """Update lead status based on bounce.
+
+        Pass a preloaded ``lead`` (see load_leads_by_email) to skip the lookup.
+        """
+        from models import Lead
         
         try:
             # Find lead by email
-            lead = Lead.query.filter_by(email=bounce.email.lower()).first()
+            if lead is None:
+                lead = Lead.query.filter_by(email=bounce.email.lower()).first()
             
             if not lead:
                 logger.warning(f"Bounced email not found in leads: {bounce.email}")
                 return False
             
-            # Update lead status
-            if bounce.bounce_type == BounceType.HARD:
-                lead.status = 'bounced'
-                lead.email_verification_status = f"Hard bounce: {bounce.reason}"
-                
-                # Stop all campaigns for this lead
-                campaign_leads = CampaignLead.query.filter_by(
-                    lead_id=lead.id,
-                    status='active'
-                ).all()
-                
-                for cl in campaign_leads:
-                    cl.status = 'stopped'
-                    logger.info(f"Stopped campaign {cl.campaign_id} for bounced lead {bounce.email}")
-                
-                logger.info(f"Marked lead as bounced (hard): {bounce.email}")
-                
-            elif bounce.bounce_type == BounceType.COMPLAINT:
-                lead.status = 'complained'
-                lead.email_verification_status = f"Spam complaint: {bounce.reason}"
-                
-                # Also stop campaigns
-                campaign_leads = CampaignLead.query.filter_by(
-                    lead_id=lead.id,
-                    status='active'
-                ).all()
-                
-                for cl in campaign_leads:
-                    cl.status = 'stopped'
-                
-                logger.info(f"Marked lead as complained: {bounce.email}")
-                
-            elif bounce.bounce_type == BounceType.SOFT:
-                # Don't change status yet, but track the bounce
-                lead.email_verification_status = f"Soft bounce ({datetime.utcnow().strftime('%Y-%m-%d')}): {bounce.reason}"
-                logger.info(f"Recorded soft bounce for: {bounce.email}")
+            if self._apply_bounce(lead, bounce):
+                stopped = self._stop_campaigns_for_leads([lead.id])
+                logger.info(f"Stopped {stopped} campaign(s) for {bounce.email}")
             
             self.session.commit()
             return True
@@ -372,20 +711,74 @@ class BounceProcessor:
             self.session.rollback()
             return False
     
+    @staticmethod
+    def dedupe_bounces(bounces: List[BounceRecord]) -> List[BounceRecord]:
+        """Collapse retry storms to one bounce per address, keeping the most severe type"""
+        by_email: Dict[str, BounceRecord] = {}
+        for bounce in bounces:
+            key = bounce.email.lower()
+            current = by_email.get(key)
+            if current is None or _BOUNCE_SEVERITY[bounce.bounce_type] >= _BOUNCE_SEVERITY[current.bounce_type]:
+                by_email[key] = bounce
+        return list(by_email.values())
+    
+    def update_lead_statuses(self, bounces: List[BounceRecord]) -> int:
+        """Apply many bounces with one lead lookup, bulk campaign stops and a single commit.
+
+        Returns the number of distinct bounced addresses matched to a lead.
+        """
+        bounces = self.dedupe_bounces(bounces)
+        if not bounces:
+            return 0
+        
+        try:
+            leads_by_email = self.load_leads_by_email(b.email for b in bounces)
+            
+            updated = 0
+            stop_ids = []
+            for bounce in bounces:
+                lead = leads_by_email.get(bounce.email.lower())
+                if not lead:
+                    logger.warning(f"Bounced email not found in leads: {bounce.email}")
+                    continue
+                if self._apply_bounce(lead, bounce):
+                    stop_ids.append(lead.id)
+                updated += 1
+            
+            if stop_ids:
+                stopped = self._stop_campaigns_for_leads(stop_ids)
+                logger.info(f"Stopped {stopped} campaign enrollment(s) for {len(set(stop_ids))} bounced lead(s)")
+            
+            self.session.commit()
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error updating lead statuses for bounces: {e}")
+            self.session.rollback()
+            return 0
+    
     def generate_bounce_report(self, days: int = 30) -> Dict:
         """Generate a bounce report for the last N days"""
         from models import Lead
+        from sqlalchemy import func
         
         since_date = datetime.utcnow() - timedelta(days=days)
         
-        # Get bounced leads
-        bounced = Lead.query.filter(
+        bounced_filter = (
             Lead.status.in_(['bounced', 'complained']),
             Lead.updated_at >= since_date
-        ).all()
+        )
         
-        hard_bounces = [b for b in bounced if b.status == 'bounced']
-        complaints = [b for b in bounced if b.status == 'complained']
+        # Count by status in SQL instead of loading every bounced lead
+        counts = dict(
+            self.session.query(Lead.status, func.count(Lead.id))
+            .filter(*bounced_filter)
+            .group_by(Lead.status)
+            .all()
+        )
+        hard_count = counts.get('bounced', 0)
+        complaint_count = counts.get('complained', 0)
+        total_bounced = hard_count + complaint_count
         
         # Calculate bounce rate
         total_sent = Lead.query.filter(
@@ -393,22 +786,29 @@ class BounceProcessor:
             Lead.updated_at >= since_date
         ).count()
         
-        bounce_rate = (len(bounced) / total_sent * 100) if total_sent > 0 else 0
+        bounce_rate = (total_bounced / total_sent * 100) if total_sent > 0 else 0
+        
+        recent = (
+            self.session.query(Lead.email, Lead.status, Lead.updated_at)
+            .filter(*bounced_filter)
+            .order_by(Lead.updated_at.desc())
+            .limit(50)  # Limit to 50 most recent
+        )
         
         report = {
             'period_days': days,
-            'total_bounced': len(bounced),
-            'hard_bounces': len(hard_bounces),
-            'complaints': len(complaints),
+            'total_bounced': total_bounced,
+            'hard_bounces': hard_count,
+            'complaints': complaint_count,
             'bounce_rate_percent': round(bounce_rate, 2),
             'bounced_emails': [
                 {
-                    'email': b.email,
-                    'status': b.status,
-                    'reason': b.status,
-                    'date': b.updated_at.isoformat() if b.updated_at else None
+                    'email': email,
+                    'status': status,
+                    'reason': status,
+                    'date': updated_at.isoformat() if updated_at else None
                 }
-                for b in bounced[:50]  # Limit to 50 most recent
+                for email, status, updated_at in recent
             ],
             'recommendations': []
         }
@@ -416,10 +816,10 @@ class BounceProcessor:
         # Add recommendations
         if bounce_rate > 5:
             report['recommendations'].append("High bounce rate detected (>5%). Review email list quality.")
-        if len(complaints) > 0:
-            report['recommendations'].append(f"{len(complaints)} spam complaints received. Review email content and sending practices.")
-        if len(hard_bounces) > 10:
-            report['recommendations'].append(f"{len(hard_bounces)} hard bounces. Consider cleaning your email list.")
+        if complaint_count > 0:
+            report['recommendations'].append(f"{complaint_count} spam complaints received. Review email content and sending practices.")
+        if hard_count > 10:
+            report['recommendations'].append(f"{hard_count} hard bounces. Consider cleaning your email list.")
         
         return report
 
@@ -442,35 +842,68 @@ class BounceCleaner:
             Lead.updated_at <= cutoff_date
         ).all()
     
+    def iter_bounced_leads(self, page_size: int = 500):
+        """Yield (id, email, status, updated_at, reason) rows for bounced leads, newest first.
+        
+        Pages with keyset pagination (id < last seen) so memory stays flat and
+        no page re-scans the rows before it, unlike OFFSET.
+        """
+        from models import Lead
+        
+        last_id = None
+        while True:
+            query = self.session.query(
+                Lead.id, Lead.email, Lead.status, Lead.updated_at,
+                Lead.email_verification_status.label('reason')
+            ).filter(Lead.status.in_(['bounced', 'complained']))
+            if last_id is not None:
+                query = query.filter(Lead.id < last_id)
+            page = query.order_by(Lead.id.desc()).limit(page_size).all()
+            if not page:
+                return
+            yield from page
+            last_id = page[-1].id
+    
     def export_bounced(self, filepath: str):
         """Export bounced emails to CSV for review"""
         from models import Lead
         import csv
         
-        bounced = Lead.query.filter(
+        # Only the exported columns, streamed from the cursor in pages
+        rows = self.session.query(
+            Lead.email,
+            Lead.status,
+            Lead.email_verification_status,
+            Lead.first_name,
+            Lead.last_name,
+            Lead.updated_at
+        ).filter(
             Lead.status.in_(['bounced', 'complained'])
-        ).all()
+        ).yield_per(500)
         
-        with open(filepath, 'w', newline='') as f:
+        count = 0
+        with open(filepath, 'w', newline='', buffering=1 << 20) as f:
             writer = csv.writer(f)
             writer.writerow(['Email', 'Status', 'Reason', 'First Name', 'Last Name', 'Bounced Date'])
             
-            for lead in bounced:
+            for email, status, reason, first_name, last_name, updated_at in rows:
                 writer.writerow([
-                    lead.email,
-                    lead.status,
-                    lead.email_verification_status or '',
-                    lead.first_name or '',
-                    lead.last_name or '',
-                    lead.updated_at.isoformat() if lead.updated_at else ''
+                    email,
+                    status,
+                    reason or '',
+                    first_name or '',
+                    last_name or '',
+                    updated_at.isoformat() if updated_at else ''
                 ])
+                count += 1
         
-        logger.info(f"Exported {len(bounced)} bounced emails to {filepath}")
-        return len(bounced)
+        logger.info(f"Exported {count} bounced emails to {filepath}")
+        return count
     
     def delete_hard_bounces(self, min_age_days: int = 30, dry_run: bool = True) -> int:
         """Permanently delete hard bounced leads after review period"""
-        from models import Lead
+        from models import Lead, SentEmail, Response
+        from sqlalchemy import select
         
         cutoff_date = datetime.utcnow() - timedelta(days=min_age_days)
         
@@ -483,16 +916,76 @@ class BounceCleaner:
             logger.info(f"[DRY RUN] Would delete {len(to_delete)} hard bounced leads")
             return len(to_delete)
         
+        # Bulk-delete in chunks, mirroring the ORM cascade from Lead to its
+        # sent emails and responses (responses first, they reference sent_emails)
+        ids = [lead.id for lead in to_delete]
+        chunk_size = BounceProcessor.IN_CLAUSE_CHUNK_SIZE
         count = 0
-        for lead in to_delete:
-            self.session.delete(lead)
-            count += 1
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            sent_ids = select(SentEmail.id).where(SentEmail.lead_id.in_(chunk))
+            Response.query.filter(Response.lead_id.in_(chunk)).delete(synchronize_session=False)
+            Response.query.filter(Response.sent_email_id.in_(sent_ids)).update(
+                {'sent_email_id': None}, synchronize_session=False
+            )
+            SentEmail.query.filter(SentEmail.lead_id.in_(chunk)).delete(synchronize_session=False)
+            count += Lead.query.filter(Lead.id.in_(chunk)).delete(synchronize_session='evaluate')
         
         self.session.commit()
         logger.info(f"Deleted {count} hard bounced leads")
         return count
 
 
+def get_imap(inbox) -> imaplib.IMAP4_SSL:
+    """Return the pooled IMAP connection for an inbox, reconnecting if it went stale"""
+    key = (inbox.imap_host, inbox.email)
+    mail = _IMAP_POOL.get(key)
+    if mail is not None:
+        try:
+            mail.noop()
+            return mail
+        except (imaplib.IMAP4.error, OSError):
+            _IMAP_POOL.pop(key, None)
+    
+    mail = imaplib.IMAP4_SSL(inbox.imap_host, inbox.imap_port, timeout=30)
+    mail.login(inbox.username, inbox.password)
+    _IMAP_POOL[key] = mail
+    return mail
+
+
+def _drop_imap(inbox):
+    """Forget a pooled connection so the next get_imap() reconnects"""
+    mail = _IMAP_POOL.pop((inbox.imap_host, inbox.email), None)
+    if mail is not None:
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+
+def close_imap_pool():
+    """Log out of every pooled IMAP connection"""
+    for mail in list(_IMAP_POOL.values()):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+    _IMAP_POOL.clear()
+
+
+def _folder_states(mail, folders: List[str]) -> Dict[str, bytes]:
+    """STATUS each existing folder; a changed MESSAGES/UIDNEXT means new mail"""
+    states = {}
+    for folder in folders:
+        try:
+            status, data = mail.status(f'"{folder}"', '(MESSAGES UIDNEXT)')
+        except imaplib.IMAP4.error:
+            continue
+        if status == 'OK' and data and data[0]:
+            states[folder] = data[0]
+    return states
+
+
 # Convenience function for running bounce check
 def check_and_process_bounces(app, db):
     """Main entry point: Check all inboxes for bounces and process them"""
@@ -505,17 +998,18 @@ def check_and_process_bounces(app, db):
         
         total_bounces = []
         
+        # Phase 1: scan every inbox without touching the database
         for inbox in inboxes:
             logger.info(f"Checking bounces for {inbox.email}...")
             bounces = processor.process_bounce_folder(inbox)
-
             for bounce in bounces:
                 logger.info(f"Bounce detected: {bounce.email} ({bounce.bounce_type.value}) - {bounce.reason[:100]}")
-                processor.update_lead_status(bounce)
-                total_bounces.append(bounce)
-
+            total_bounces.extend(bounces)
             logger.info(f"Found {len(bounces)} bounces in {inbox.email}")
         
+        # Phase 2: resolve all bounced addresses to leads and update them in one transaction
+        processor.update_lead_statuses(total_bounces)
+        
         # Generate report
         report = processor.generate_bounce_report(days=30)
         
@@ -525,6 +1019,65 @@ def check_and_process_bounces(app, db):
         }
 
 
+def watch_bounces(app, db, poll_interval: int = 300, max_cycles: Optional[int] = None) -> int:
+    """Daemon mode: keep IMAP sessions open and rescan only folders that changed
+    
+    Every poll_interval seconds each bounce folder is STATUS-checked over the
+    pooled connection (NOOP keeps it alive). A rescan covers the whole lookback
+    window, so bounce messages already handled are skipped by Message-ID and
+    recipient. Returns the number of new bounces found.
+    """
+    from models import Inbox
+    
+    processor = BounceProcessor(db.session, keep_alive=True)
+    folder_state: Dict[str, Dict[str, bytes]] = {}
+    seen: Set[Tuple[Optional[str], str]] = set()
+    total = 0
+    cycles = 0
+    
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            cycles += 1
+            with app.app_context():
+                inboxes = Inbox.query.filter_by(active=True).all()
+                bounces = []
+                
+                for inbox in inboxes:
+                    try:
+                        mail = get_imap(inbox)
+                        states = _folder_states(mail, processor.BOUNCE_FOLDERS)
+                    except Exception as e:
+                        logger.error(f"Could not reach {inbox.email}: {e}")
+                        _drop_imap(inbox)
+                        continue
+                    
+                    previous = folder_state.get(inbox.email, {})
+                    changed = [folder for folder, state in states.items() if previous.get(folder) != state]
+                    folder_state[inbox.email] = states
+                    
+                    if changed:
+                        logger.info(f"Scanning {inbox.email}: {', '.join(changed)}")
+                        for bounce in processor.process_bounce_folder(inbox, folders=changed):
+                            key = (bounce.message_id, bounce.email.lower())
+                            if key not in seen:
+                                seen.add(key)
+                                bounces.append(bounce)
+                
+                if bounces:
+                    processor.update_lead_statuses(bounces)
+                    total += len(bounces)
+                    logger.info(f"Processed {len(bounces)} bounces")
+            
+            if max_cycles is not None and cycles >= max_cycles:
+                break
+            
+            time.sleep(poll_interval)
+    finally:
+        close_imap_pool()
+    
+    return total
+
+
 if __name__ == '__main__':
     import sys, os
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -15,6 +15,7 @@ import sys
 
 IMAP_HOST = "mail.spacemail.com"
 IMAP_PORT = 993
+INBOX_EMAIL = "hello@weddingcounselors.com"
 CRM_DB = "/Users/lawrence/Desktop/email/crm/instance/crm.db"
 AUDIT_DB = "/Users/lawrence/Desktop/email/crm/crm-audit.db"
 
@@ -98,18 +99,16 @@ print("=" * 80)
 print("\n[1] Loading IMAP credentials from CRM database...")
 conn = sqlite3.connect(CRM_DB)
 cur = conn.cursor()
-cur.execute(
-    "SELECT username, password FROM inboxes WHERE email = 'hello@weddingcounselors.com'"
-)
+cur.execute("SELECT username, password FROM inboxes WHERE email = ?", (INBOX_EMAIL,))
 row = cur.fetchone()
 conn.close()
 
 if not row:
-    print("ERROR: Could not find inbox credentials for hello@weddingcounselors.com")
+    print(f"ERROR: Could not find inbox credentials for {INBOX_EMAIL}")
     sys.exit(1)
 
 imap_user, imap_pass = row
-print(f"    Inbox: hello@weddingcounselors.com")
+print(f"    Inbox: {INBOX_EMAIL}")
 print(f"    IMAP:  {IMAP_HOST}:{IMAP_PORT} (SSL)")
 
 # ── Connect to IMAP and search ────────────────────────────────────────────
@@ -203,7 +202,8 @@ cur.execute(
     f"SELECT email, status, first_name, last_name FROM leads WHERE email IN ({placeholders}) ORDER BY status, email",
     NUDGE_RECIPIENTS,
 )
-for row in cur.fetchall():
+lead_rows = cur.fetchall()
+for row in lead_rows:
     email_addr, status, first, last = row
     name = f"{first or ''} {last or ''}".strip() or "(unknown)"
     print(f"    {email_addr:<42} {status or 'n/a':<12} {name}")
@@ -252,17 +252,9 @@ print(f"\n{'=' * 80}")
 print("SUMMARY: WHO HAS NOT REPLIED?")
 print(f"{'=' * 80}")
 
-cur.execute(
-    f"SELECT email FROM leads WHERE email IN ({placeholders}) AND status = 'responded'",
-    NUDGE_RECIPIENTS,
-)
-responded_emails = {row[0] for row in cur.fetchall()}
-
-cur.execute(
-    f"SELECT email, status FROM leads WHERE email IN ({placeholders})",
-    NUDGE_RECIPIENTS,
-)
-all_leads = {row[0]: row[1] for row in cur.fetchall()}
+# Reuse the lead rows from [4] instead of querying the same leads twice more
+all_leads = {row[0]: row[1] for row in lead_rows}
+responded_emails = {em for em, status in all_leads.items() if status == 'responded'}
 
 print(f"\n  RESPONDED ({len(responded_emails)}):")
 for em in sorted(responded_emails):
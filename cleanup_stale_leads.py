@@ -26,8 +26,10 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+from sqlalchemy import func
+
 from app import app
-from models import db, CampaignLead, SentEmail
+from models import db, CampaignLead, Lead, SentEmail
 
 
 def main():
@@ -35,30 +37,47 @@ def main():
 
     with app.app_context():
         cutoff = datetime.utcnow() - timedelta(days=10)
-        active_cls = CampaignLead.query.filter_by(status='active').all()
+
+        # Last send per (lead, campaign), joined to the active enrollments in one query
+        last_sends = db.session.query(
+            SentEmail.lead_id,
+            SentEmail.campaign_id,
+            func.max(SentEmail.sent_at).label('sent_at')
+        ).group_by(SentEmail.lead_id, SentEmail.campaign_id).subquery()
+
+        rows = db.session.query(CampaignLead, Lead.email, SentEmail.subject).join(
+            last_sends,
+            (last_sends.c.lead_id == CampaignLead.lead_id) &
+            (last_sends.c.campaign_id == CampaignLead.campaign_id)
+        ).join(
+            SentEmail,
+            (SentEmail.lead_id == last_sends.c.lead_id) &
+            (SentEmail.campaign_id == last_sends.c.campaign_id) &
+            (SentEmail.sent_at == last_sends.c.sent_at)
+        ).join(Lead, Lead.id == CampaignLead.lead_id).filter(
+            CampaignLead.status == 'active',
+            last_sends.c.sent_at < cutoff
+        ).all()
 
         cleaned = 0
         cleaned_emails = []
+        seen = set()
 
-        for cl in active_cls:
-            # Find the last email sent to this lead in this campaign
-            last_sent = SentEmail.query.filter_by(
-                lead_id=cl.lead_id,
-                campaign_id=cl.campaign_id
-            ).order_by(SentEmail.sent_at.desc()).first()
-
-            if not last_sent:
+        for cl, email, subject in rows:
+            # Two sends with the same timestamp: judge the enrollment once
+            if cl.id in seen:
                 continue
+            seen.add(cl.id)
 
             # Check: sent 10+ days ago with the bad subject
-            subject_lower = (last_sent.subject or '').lower()
-            if last_sent.sent_at < cutoff and 'directory listing' in subject_lower:
-                lead = cl.lead
+            if 'directory listing' in (subject or '').lower():
                 cl.status = 'completed'
-                db.session.commit()
                 cleaned += 1
-                cleaned_emails.append(lead.email)
-                print(f"  Cleaned: {lead.email} (campaign {cl.campaign_id}, subject: {last_sent.subject!r})")
+                cleaned_emails.append(email)
+                print(f"  Cleaned: {email} (campaign {cl.campaign_id}, subject: {subject!r})")
+
+        # All status changes in one transaction
+        db.session.commit()
 
         print(f"\nTotal cleaned: {cleaned}")
 
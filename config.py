@@ -19,8 +19,8 @@ class Config:
 
     # Pass auth token to libsql driver if using Turso
     SQLALCHEMY_ENGINE_OPTIONS = (
-        {'connect_args': {'auth_token': os.getenv('TURSO_AUTH_TOKEN')}}
-        if os.getenv('TURSO_AUTH_TOKEN')
+        {'connect_args': {'auth_token': TURSO_AUTH_TOKEN}}
+        if TURSO_AUTH_TOKEN
         else {}
     )
 
@@ -32,6 +32,15 @@ class Config:
     # Scheduler
     RESPONSE_CHECK_INTERVAL_MINUTES = int(os.getenv('RESPONSE_CHECK_INTERVAL', '10'))
     SEND_CHECK_INTERVAL_MINUTES = int(os.getenv('SEND_CHECK_INTERVAL', '60'))
+    AUTO_REPLY_INTERVAL_MINUTES = int(os.getenv('AUTO_REPLY_INTERVAL', '15'))
+    # Adaptive polling: a send/auto-reply run that handles its job's batch target
+    # halves the interval, one that handles a quarter of that or less doubles it,
+    # between POLL_INTERVAL_MIN and the job's max. Response checks stay fixed.
+    POLL_INTERVAL_MIN_MINUTES = float(os.getenv('POLL_INTERVAL_MIN', '1'))
+    SEND_BATCH_TARGET = int(os.getenv('SEND_BATCH_TARGET', '5'))
+    SEND_CHECK_INTERVAL_MAX_MINUTES = int(os.getenv('SEND_CHECK_INTERVAL_MAX', '120'))
+    AUTO_REPLY_BATCH_TARGET = int(os.getenv('AUTO_REPLY_BATCH_TARGET', '4'))
+    AUTO_REPLY_INTERVAL_MAX_MINUTES = int(os.getenv('AUTO_REPLY_INTERVAL_MAX', '60'))
 
     # Security
     BASIC_AUTH_USERNAME = os.getenv('AUTH_USERNAME', 'admin')
@@ -8,6 +8,7 @@ import os
 import sys
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
@@ -19,11 +20,12 @@ sys.path.insert(0, script_dir)
 from dotenv import load_dotenv
 load_dotenv()
 
-from app import app, _ensure_response_columns
+from app import app, _ensure_response_columns, _ensure_indexes
 from models import db, Lead, Inbox, Campaign, Sequence, CampaignLead, SentEmail, Response
 from email_handler import EmailSender, EmailReceiver, EmailPersonalizer, RateLimiter
 from email_templates import wrap_email_html, build_unsubscribe_url
 from config import Config
+from scheduler import IMAP_WORKERS
 
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,6 +36,8 @@ with app.app_context():
     _ensure_response_columns()
     # Create any new tables (e.g. suppressions) that don't exist yet
     db.create_all()
+    # create_all() skips indexes on tables that already exist
+    _ensure_indexes()
 
     # One-time: pause underperforming campaigns B/C/D (0% reply rate)
     # and reassign their active leads to Campaign A (10-55% reply rate).
@@ -157,6 +161,7 @@ def send_scheduled_emails():
         from email_verifier import EmailVerifier
         verifier = EmailVerifier(db.session)
         ready_by_campaign = {c.id: [] for c in active_campaigns}
+        now = datetime.utcnow()  # one reference time for every follow-up delay check below
 
         # Keep track of inbox rotation per campaign
         campaign_inbox_rotation = {}
@@ -188,6 +193,7 @@ def send_scheduled_emails():
 
             if not campaign_sequences:
                 continue
+            step_by_sequence_id = {s.id: s.step_number for s in campaign_sequences}
 
             # Load leads with their sent emails in one query
             campaign_leads = CampaignLead.query.filter_by(
@@ -240,7 +246,10 @@ def send_scheduled_emails():
                 last_sent = last_sent_map.get(lead.id)
 
                 if last_sent:
-                    last_step = last_sent.sequence.step_number
+                    last_step = step_by_sequence_id.get(last_sent.sequence_id)
+                    if last_step is None:
+                        # Last step sent has since been deactivated
+                        last_step = last_sent.sequence.step_number
                     # Find next active sequence
                     next_sequence = next((s for s in campaign_sequences if s.step_number > last_step), None)
 
@@ -249,7 +258,7 @@ def send_scheduled_emails():
                         continue
 
                     delay_days = next_sequence.delay_days
-                    if datetime.utcnow() < last_sent.sent_at + timedelta(days=delay_days):
+                    if now < last_sent.sent_at + timedelta(days=delay_days):
                         continue
                 else:
                     # First step of campaign
@@ -308,6 +317,9 @@ def send_scheduled_emails():
         inbox_last_used_index = {cid: 0 for cid in ready_by_campaign.keys()}
         
         sent_per_campaign = {}  # track per-campaign for fairness logging
+        # Earliest time.monotonic() each inbox may send again; the human-like gap
+        # is kept per mailbox, so rotating inboxes don't wait on each other
+        inbox_ready_at = {}
         for campaign, cl, lead, next_sequence, inboxes in interleaved:
             # Round-robin inbox selection
             start_idx = inbox_last_used_index[campaign.id]
@@ -358,12 +370,18 @@ def send_scheduled_emails():
                 continue
 
             try:
-                subject = personalizer.personalize(next_sequence.subject_template, lead)
-                body = personalizer.personalize(next_sequence.email_template, lead)
+                values = personalizer.template_values(lead)
+                subject = personalizer.personalize(next_sequence.subject_template, lead, values)
+                body = personalizer.personalize(next_sequence.email_template, lead, values)
 
                 body_html = wrap_email_html(body, inbox.email, lead=lead)
                 unsubscribe_url = build_unsubscribe_url(lead)
 
+                wait = inbox_ready_at.get(inbox.id, 0) - time.monotonic()
+                if wait > 0:
+                    logger.info(f"Waiting {wait:.0f}s before next send from {inbox.email}...")
+                    time.sleep(wait)
+
                 sender = EmailSender(inbox)
                 success, message_id, error = sender.send_email(
                     to_email=lead.email,
@@ -403,11 +421,9 @@ def send_scheduled_emails():
 
                     logger.info(f"Sent email to {lead.email} (campaign={campaign.id}, step {next_sequence.step_number})")
 
-                    # Random delay between sends to mimic human sending patterns
-                    # and avoid spam filter detection (30-90s range)
-                    delay = random.uniform(30, 90)
-                    logger.info(f"Waiting {delay:.0f}s before next send...")
-                    time.sleep(delay)
+                    # Random delay between sends from this inbox to mimic human
+                    # sending patterns and avoid spam filter detection (30-90s range)
+                    inbox_ready_at[inbox.id] = time.monotonic() + random.uniform(30, 90)
 
                     sent_this_run += 1
                     if sent_this_run >= remaining_today:
@@ -489,97 +505,104 @@ def check_responses():
         inboxes = Inbox.query.filter_by(active=True).all()
         new_responses = 0
 
-        for inbox in inboxes:
-            try:
-                receiver = EmailReceiver(inbox)
-                responses = receiver.fetch_new_responses()
-
-                for resp_data in responses:
-                    in_reply_to = resp_data.get('in_reply_to')
-                    sent_email = None
-                    lead = None
-
-                    # --- Match via In-Reply-To header ---
-                    if in_reply_to:
-                        # Try as-is (stripped of angle brackets by email_handler)
-                        sent_email = SentEmail.query.filter_by(message_id=in_reply_to).first()
-                        # Try with angle brackets (message_ids are stored with brackets)
-                        if not sent_email:
-                            sent_email = SentEmail.query.filter_by(message_id=f'<{in_reply_to}>').first()
-                        if sent_email:
-                            lead = sent_email.lead
-
-                    # --- Fallback: match by sender email address ---
-                    from_field = resp_data.get('from', '')
-                    email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_field)
-                    from_email = email_match.group(0) if email_match else None
-
-                    if not lead and from_email:
-                        lead = Lead.query.filter_by(email=from_email).first()
-                        # Try to find the most recent SentEmail for A/B attribution
-                        if lead and not sent_email:
-                            sent_email = SentEmail.query.filter_by(
-                                lead_id=lead.id,
-                                status='sent'
-                            ).order_by(SentEmail.sent_at.desc()).first()
+        # IMAP fetches are network-bound and independent per inbox, so they run
+        # concurrently; results are recorded here on this thread's session.
+        with ThreadPoolExecutor(max_workers=min(IMAP_WORKERS, len(inboxes)) or 1) as pool:
+            futures = {
+                pool.submit(EmailReceiver(inbox).fetch_new_responses): inbox
+                for inbox in inboxes
+            }
+            for future in as_completed(futures):
+                inbox = futures[future]
+                try:
+                    responses = future.result()
+
+                    for resp_data in responses:
+                        in_reply_to = resp_data.get('in_reply_to')
+                        sent_email = None
+                        lead = None
+
+                        # --- Match via In-Reply-To header ---
+                        if in_reply_to:
+                            # Try as-is (stripped of angle brackets by email_handler)
+                            sent_email = SentEmail.query.filter_by(message_id=in_reply_to).first()
+                            # Try with angle brackets (message_ids are stored with brackets)
+                            if not sent_email:
+                                sent_email = SentEmail.query.filter_by(message_id=f'<{in_reply_to}>').first()
                             if sent_email:
-                                logger.info(f"Fallback attribution: linked reply from {lead.email} to campaign {sent_email.campaign_id}")
-
-                    # Skip emails from ourselves or unknown senders
-                    if not lead:
-                        continue
-
-                    # --- Duplicate check ---
-                    msg_id = resp_data.get('message_id')
-                    if msg_id:
-                        existing = Response.query.filter_by(message_id=msg_id).first()
-                        if existing:
+                                lead = sent_email.lead
+
+                        # --- Fallback: match by sender email address ---
+                        from_field = resp_data.get('from', '')
+                        email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_field)
+                        from_email = email_match.group(0) if email_match else None
+
+                        if not lead and from_email:
+                            lead = Lead.query.filter_by(email=from_email).first()
+                            # Try to find the most recent SentEmail for A/B attribution
+                            if lead and not sent_email:
+                                sent_email = SentEmail.query.filter_by(
+                                    lead_id=lead.id,
+                                    status='sent'
+                                ).order_by(SentEmail.sent_at.desc()).first()
+                                if sent_email:
+                                    logger.info(f"Fallback attribution: linked reply from {lead.email} to campaign {sent_email.campaign_id}")
+
+                        # Skip emails from ourselves or unknown senders
+                        if not lead:
                             continue
 
-                    # --- Create new response record ---
-                    response = Response(
-                        lead_id=lead.id,
-                        sent_email_id=sent_email.id if sent_email else None,
-                        message_id=msg_id,
-                        in_reply_to=in_reply_to,
-                        references=resp_data.get('references'),
-                        subject=resp_data.get('subject'),
-                        body=resp_data.get('body'),
-                        reviewed=False
-                    )
-
-                    # --- OOO return date detection ---
-                    body_lower = (resp_data.get('body') or '').lower()
-                    subject_lower = (resp_data.get('subject') or '').lower()
-                    combined = subject_lower + ' ' + body_lower
-                    is_ooo = any(x in combined for x in [
-                        'out of office', 'auto-reply', 'automatic reply',
-                        'on vacation', 'away from', 'out of the office'
-                    ])
-                    if is_ooo:
-                        return_date = _parse_ooo_return_date(resp_data.get('body') or '')
-                        if return_date:
-                            response.notes = f"OOO_RETURN:{return_date}"
-                            logger.info(f"OOO detected for {lead.email}, return date: {return_date}")
-
-                    db.session.add(response)
-
-                    lead.status = 'responded'
-
-                    # Stop active campaigns for this lead
-                    campaign_leads = CampaignLead.query.filter_by(
-                        lead_id=lead.id,
-                        status='active'
-                    ).all()
-                    for cl in campaign_leads:
-                        cl.status = 'stopped'
-
-                    db.session.commit()
-                    new_responses += 1
-                    logger.info(f"NEW RESPONSE from {lead.email} (lead {lead.id}): {resp_data.get('subject', '')[:60]}")
-
-            except Exception as e:
-                logger.error(f"Error checking inbox {inbox.email}: {e}")
+                        # --- Duplicate check ---
+                        msg_id = resp_data.get('message_id')
+                        if msg_id:
+                            existing = Response.query.filter_by(message_id=msg_id).first()
+                            if existing:
+                                continue
+
+                        # --- Create new response record ---
+                        response = Response(
+                            lead_id=lead.id,
+                            sent_email_id=sent_email.id if sent_email else None,
+                            message_id=msg_id,
+                            in_reply_to=in_reply_to,
+                            references=resp_data.get('references'),
+                            subject=resp_data.get('subject'),
+                            body=resp_data.get('body'),
+                            reviewed=False
+                        )
+
+                        # --- OOO return date detection ---
+                        body_lower = (resp_data.get('body') or '').lower()
+                        subject_lower = (resp_data.get('subject') or '').lower()
+                        combined = subject_lower + ' ' + body_lower
+                        is_ooo = any(x in combined for x in [
+                            'out of office', 'auto-reply', 'automatic reply',
+                            'on vacation', 'away from', 'out of the office'
+                        ])
+                        if is_ooo:
+                            return_date = _parse_ooo_return_date(resp_data.get('body') or '')
+                            if return_date:
+                                response.notes = f"OOO_RETURN:{return_date}"
+                                logger.info(f"OOO detected for {lead.email}, return date: {return_date}")
+
+                        db.session.add(response)
+
+                        lead.status = 'responded'
+
+                        # Stop active campaigns for this lead
+                        campaign_leads = CampaignLead.query.filter_by(
+                            lead_id=lead.id,
+                            status='active'
+                        ).all()
+                        for cl in campaign_leads:
+                            cl.status = 'stopped'
+
+                        db.session.commit()
+                        new_responses += 1
+                        logger.info(f"NEW RESPONSE from {lead.email} (lead {lead.id}): {resp_data.get('subject', '')[:60]}")
+
+                except Exception as e:
+                    logger.error(f"Error checking inbox {inbox.email}: {e}")
 
     logger.info(f"Response check job completed: {new_responses} new response(s) recorded")
 
@@ -1,17 +1,52 @@
 import smtplib
 import imaplib
 import email
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
+import atexit
+import threading
+from email.message import EmailMessage
+from email.policy import SMTP as SMTP_POLICY
 from email.utils import make_msgid, formataddr
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from functools import lru_cache
+from typing import Optional, List, Dict, Tuple
 import re
 import logging
+from sqlalchemy import func
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bodies are encoded under SMTP_POLICY (CRLF, RFC 2045's 76-column QP/base64
+# lines); headers are then generated under MESSAGE_POLICY, which folds only
+# past RFC 5322's 998-char limit. At 78 columns long List-Unsubscribe URLs
+# would be RFC 2047-encoded and break.
+MESSAGE_POLICY = SMTP_POLICY.clone(max_line_length=998)
+
+# Logged-in SMTP sessions reused across sends: (smtp_host, username) -> [server, sent]
+_SMTP_POOL: Dict[Tuple[str, str], list] = {}
+# One lock per pooled session, so a slow server only holds up sends from its own
+# inbox; _SMTP_LOCK guards just the lookup/creation of these locks
+_SMTP_KEY_LOCKS: Dict[Tuple[str, str], threading.Lock] = {}
+_SMTP_LOCK = threading.Lock()
+
+
+def _smtp_key_lock(key: Tuple[str, str]) -> threading.Lock:
+    """Return the lock serializing use of the pooled session for `key`"""
+    with _SMTP_LOCK:
+        lock = _SMTP_KEY_LOCKS.get(key)
+        if lock is None:
+            lock = _SMTP_KEY_LOCKS[key] = threading.Lock()
+        return lock
+
+# Recycle a session after this many messages
+MAX_MESSAGES_PER_CONNECTION = 100
+
+# HTML -> plain text: entities decoded in one pass, so "&amp;lt;" stays "&lt;"
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_HTML_ENTITY_RE = re.compile(r'&(nbsp|amp|lt|gt);')
+_HTML_ENTITIES = {'nbsp': ' ', 'amp': '&', 'lt': '<', 'gt': '>'}
+
 
 class RateLimiter:
     """Rate limiting for email sending per inbox"""
@@ -33,6 +68,17 @@ class RateLimiter:
 
         return sent_count < max_per_hour
 
+    def get_hourly_counts(self) -> Dict[int, int]:
+        """Map inbox_id -> emails sent in the last hour, for every inbox in one query"""
+        from models import SentEmail
+
+        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
+
+        return dict(self.db.query(SentEmail.inbox_id, func.count()).filter(
+            SentEmail.sent_at >= one_hour_ago,
+            SentEmail.status == 'sent'
+        ).group_by(SentEmail.inbox_id).all())
+
     def get_available_inbox(self, inbox_ids: List[int], max_per_hour: int) -> Optional[int]:
         """Get the first available inbox that can send (round-robin)"""
         for inbox_id in inbox_ids:
@@ -70,12 +116,15 @@ class EmailSender:
         self.password = inbox.password
         self.from_email = inbox.email
         self.from_name = inbox.name
+        # Per-inbox header parts, computed once rather than on every send
+        self.from_header = formataddr((self.from_name, self.from_email))
+        self.msgid_domain = self.from_email.rpartition('@')[2]
 
     def send_email(
         self,
         to_email: str,
         subject: str,
-        body_html: str,
+        body_html: Optional[str],
         body_plain: Optional[str] = None,
         bcc: Optional[str] = None,
         in_reply_to: Optional[str] = None,
@@ -83,20 +132,21 @@ class EmailSender:
         unsubscribe_url: Optional[str] = None
     ) -> tuple[bool, Optional[str], Optional[str]]:
         """
-        Send an email via SMTP
+        Send an email via SMTP. With body_html=None the message is a single
+        text/plain part built from body_plain.
 
         Returns: (success: bool, message_id: str, error_message: str)
         """
         try:
             # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = formataddr((self.from_name, self.from_email))
+            msg = EmailMessage(policy=SMTP_POLICY)
+            msg['From'] = self.from_header
             msg['To'] = to_email
             msg['Subject'] = subject
             msg['Date'] = email.utils.formatdate(localtime=True)
 
             # Generate unique Message-ID
-            message_id = make_msgid(domain=self.from_email.split('@')[1])
+            message_id = make_msgid(domain=self.msgid_domain)
             msg['Message-ID'] = message_id
 
             # Threading headers for reply-in-thread
@@ -114,28 +164,35 @@ class EmailSender:
             if body_plain is None:
                 body_plain = self._html_to_plain(body_html)
 
-            msg.attach(MIMEText(body_plain, 'plain'))
-            msg.attach(MIMEText(body_html, 'html'))
+            # multipart/alternative built in one pass by the modern email API
+            msg.set_content(body_plain)
+            if body_html is not None:
+                msg.add_alternative(body_html, subtype='html')
+            msg.policy = MESSAGE_POLICY
 
             # Build recipient list (to + bcc)
             recipients = [to_email]
             if bcc:
                 recipients.append(bcc)
 
-            # Connect and send
-            if self.smtp_use_tls:
-                server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
-                server.starttls()
-            else:
-                server = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port, timeout=30)
-
-            server.login(self.username, self.password)
-            server.sendmail(self.from_email, recipients, msg.as_string())
-            server.quit()
+            # Serialized once to CRLF bytes (SMTP policy) and reused for the SMTP
+            # send and the Sent-folder copy; the pooled session skips TLS + AUTH
+            # on every send after the first
+            raw_message = msg.as_bytes()
+            with _smtp_key_lock((self.smtp_host, self.username)):
+                # _get_smtp() has already NOOP-checked a reused session. A disconnect
+                # during sendmail is a failed send, not a retry: the server may have
+                # accepted the message before the connection dropped.
+                try:
+                    self._get_smtp().sendmail(self.from_email, recipients, raw_message)
+                except smtplib.SMTPServerDisconnected:
+                    self._drop_smtp()
+                    raise
+                _SMTP_POOL[(self.smtp_host, self.username)][1] += 1
 
             # Save copy to Sent folder via IMAP
             try:
-                self._save_to_sent_folder(msg)
+                self._save_to_sent_folder(raw_message)
             except Exception as e:
                 logger.warning(f"Could not save to Sent folder: {e}")
 
@@ -157,30 +214,74 @@ class EmailSender:
             logger.error(error_msg)
             return False, None, error_msg
 
-    def _save_to_sent_folder(self, msg):
-        """Save a copy of the sent email to IMAP Sent folder"""
-        import imaplib
-        import time
+    def _connect_smtp(self, timeout: int = 30):
+        """Open and log in a new SMTP session for this inbox; the socket is closed if setup fails"""
+        if self.smtp_use_tls:
+            server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=timeout)
+        else:
+            server = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port, timeout=timeout)
 
         try:
-            mail = imaplib.IMAP4_SSL(self.imap_host, self.imap_port, timeout=30)
-            mail.login(self.username, self.password)
+            if self.smtp_use_tls:
+                server.starttls()
+                server.ehlo()  # re-read extensions (SMTPUTF8, 8BITMIME) over TLS
+            server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _get_smtp(self):
+        """Return the pooled SMTP session for this inbox, reconnecting if it is spent or stale
 
-            # Try common sent folder names
-            sent_folders = ['Sent', '[Gmail]/Sent Mail', 'INBOX.Sent', 'Sent Items', 'Sent Mail']
-            for folder in sent_folders:
+        A reused session is NOOP-checked first, so a dropped connection is
+        replaced before any message goes out on it.
+        """
+        key = (self.smtp_host, self.username)
+        entry = _SMTP_POOL.get(key)
+        if entry is not None:
+            server, sent = entry
+            if sent < MAX_MESSAGES_PER_CONNECTION:
                 try:
-                    status, _ = mail.select(folder)
-                    if status == 'OK':
-                        # Append message to Sent folder
-                        mail.append(folder, '\\Seen', imaplib.Time2Internaldate(time.time()), msg.as_bytes())
-                        logger.info(f"Saved copy to Sent folder: {folder}")
-                        mail.logout()
-                        return True
-                except:
-                    continue
+                    if server.noop()[0] == 250:
+                        return server
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self._drop_smtp()
+
+        server = self._connect_smtp()
+        _SMTP_POOL[key] = [server, 0]
+        return server
+
+    def _drop_smtp(self):
+        """Forget the pooled session so the next _get_smtp() reconnects"""
+        entry = _SMTP_POOL.pop((self.smtp_host, self.username), None)
+        if entry is not None:
+            try:
+                entry[0].quit()
+            except Exception:
+                pass
+
+    def _save_to_sent_folder(self, raw_message: bytes):
+        """Save a copy of the sent email (already serialized) to IMAP Sent folder"""
+        try:
+            # The with block logs out on every path, including a failed login
+            with imaplib.IMAP4_SSL(self.imap_host, self.imap_port, timeout=30) as mail:
+                mail.login(self.username, self.password)
+
+                # Try common sent folder names
+                sent_folders = ['Sent', '[Gmail]/Sent Mail', 'INBOX.Sent', 'Sent Items', 'Sent Mail']
+                for folder in sent_folders:
+                    try:
+                        status, _ = mail.select(folder)
+                        if status == 'OK':
+                            # Append message to Sent folder
+                            mail.append(folder, '\\Seen', imaplib.Time2Internaldate(time.time()), raw_message)
+                            logger.info(f"Saved copy to Sent folder: {folder}")
+                            return True
+                    except:
+                        continue
 
-            mail.logout()
             logger.warning("Could not find Sent folder to save copy")
             return False
 
@@ -191,25 +292,16 @@ class EmailSender:
     def _html_to_plain(self, html: str) -> str:
         """Convert HTML to plain text (basic)"""
         # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', html)
+        text = _HTML_TAG_RE.sub('', html)
         # Decode HTML entities
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&amp;', '&')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
+        text = _HTML_ENTITY_RE.sub(lambda m: _HTML_ENTITIES[m.group(1)], text)
         return text.strip()
 
     def test_connection(self) -> tuple[bool, Optional[str]]:
         """Test SMTP connection and credentials"""
         try:
-            if self.smtp_use_tls:
-                server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10)
-                server.starttls()
-            else:
-                server = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port, timeout=10)
-
-            server.login(self.username, self.password)
-            server.quit()
+            # A fresh session, not the pooled one, so bad credentials fail here
+            self._connect_smtp(timeout=10).quit()
 
             return True, "Connection successful"
 
@@ -217,12 +309,42 @@ class EmailSender:
             return False, str(e)
 
 
+def close_smtp_pool():
+    """Quit every pooled SMTP session"""
+    for key in list(_SMTP_POOL):
+        with _smtp_key_lock(key):
+            entry = _SMTP_POOL.pop(key, None)
+            if entry is not None:
+                try:
+                    entry[0].quit()
+                except Exception:
+                    pass
+
+
+atexit.register(close_smtp_pool)
+
+
+def build_references(*message_ids: Optional[str]) -> Optional[str]:
+    """References header value from message ids / id chains, oldest first: bracketed, de-duplicated"""
+    seen = set()
+    refs = []
+    for chain in message_ids:
+        for ref in (chain or '').split():
+            if not ref.startswith('<'):
+                ref = f'<{ref}>'
+            if ref not in seen:
+                seen.add(ref)
+                refs.append(ref)
+    return ' '.join(refs) or None
+
+
 class EmailReceiver:
     """Handle IMAP email receiving"""
 
     def __init__(self, inbox):
         """Initialize with an Inbox model instance"""
         self.inbox = inbox
+        self.email = inbox.email
         self.imap_host = inbox.imap_host
         self.imap_port = inbox.imap_port
         self.imap_use_ssl = inbox.imap_use_ssl
@@ -275,6 +397,10 @@ class EmailReceiver:
         responses = []
         seen_message_ids = set()
 
+        # Search for messages from the last 14 days (catches read emails too)
+        # Extended from 3 days to survive cron outages without losing replies
+        since_date = (datetime.utcnow() - timedelta(days=14)).strftime('%d-%b-%Y')
+
         for folder in self.SCAN_FOLDERS:
             try:
                 mail = self._connect_imap(folder)
@@ -285,9 +411,6 @@ class EmailReceiver:
                 continue
 
             try:
-                # Search for messages from the last 14 days (catches read emails too)
-                # Extended from 3 days to survive cron outages without losing replies
-                since_date = (datetime.utcnow() - timedelta(days=14)).strftime('%d-%b-%Y')
                 status, messages = mail.search(None, f'SINCE {since_date}')
 
                 if status != 'OK' or not messages[0].strip():
@@ -367,12 +490,12 @@ class EmailReceiver:
                     pass
 
             except imaplib.IMAP4.error as e:
-                logger.error(f"IMAP error for {self.inbox.email} folder {folder}: {str(e)}")
+                logger.error(f"IMAP error for {self.email} folder {folder}: {str(e)}")
 
             except Exception as e:
-                logger.error(f"Unexpected error fetching from {self.inbox.email} folder {folder}: {str(e)}")
+                logger.error(f"Unexpected error fetching from {self.email} folder {folder}: {str(e)}")
 
-        logger.info(f"Fetched {len(responses)} new responses from {self.inbox.email} (scanned {len(self.SCAN_FOLDERS)} folders)")
+        logger.info(f"Fetched {len(responses)} new responses from {self.email} (scanned {len(self.SCAN_FOLDERS)} folders)")
         return responses
 
     def _get_email_body(self, email_message) -> str:
@@ -428,24 +551,18 @@ class EmailReceiver:
 
     def _html_to_plain(self, html: str) -> str:
         """Convert HTML to plain text (basic)"""
-        text = re.sub(r'<[^>]+>', '', html)
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&amp;', '&')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
+        text = _HTML_TAG_RE.sub('', html)
+        text = _HTML_ENTITY_RE.sub(lambda m: _HTML_ENTITIES[m.group(1)], text)
         return text.strip()
 
     def test_connection(self) -> tuple[bool, Optional[str]]:
         """Test IMAP connection and credentials"""
         try:
-            if self.imap_use_ssl:
-                mail = imaplib.IMAP4_SSL(self.imap_host, self.imap_port, timeout=10)
-            else:
-                mail = imaplib.IMAP4(self.imap_host, self.imap_port, timeout=10)
-
-            mail.login(self.username, self.password)
-            mail.select('INBOX')
-            mail.logout()
+            imap_class = imaplib.IMAP4_SSL if self.imap_use_ssl else imaplib.IMAP4
+            # The with block logs out (closing the socket) even when login fails
+            with imap_class(self.imap_host, self.imap_port, timeout=10) as mail:
+                mail.login(self.username, self.password)
+                mail.select('INBOX')
 
             return True, "Connection successful"
 
@@ -453,6 +570,44 @@ class EmailReceiver:
             return False, str(e)
 
 
+# {variable} or {variable|fallback} in sequence templates
+_TEMPLATE_VAR_RE = re.compile(r'\{(\w+)(?:\|([^}]+))?\}')
+
+
+@lru_cache(maxsize=128)
+def _split_template(template: str) -> tuple:
+    """Split a template once into literal text and (name, fallback) slots.
+
+    Returns (text, name, fallback, text, name, fallback, ..., text); sequence
+    templates repeat across every lead, so each distinct one is parsed once.
+    """
+    return tuple(_TEMPLATE_VAR_RE.split(template))
+
+
+_GREETING_FIXES = [
+    (re.compile(r'(Hi|Hello|Hey)\s*,'), r'\1 there,'),
+    (re.compile(r'(Hi|Hello|Hey)\s*!'), r'\1 there!'),
+    (re.compile(r'(Hi|Hello|Hey)\s*\n'), r'\1 there\n'),
+]
+
+# Company "names" that are really dates, page numbers or scraped page furniture;
+# one alternation so each lead costs a single scan
+_GARBAGE_COMPANY_RE = re.compile(
+    r'^(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d'
+    r'|^\d{4}[-/]?\d{0,2}[-/]?\d{0,2}$'
+    r'|page \d+ of \d+'
+    r'|(?:^|\s)contact\s*form'
+    r'|^(?:archives|contact\s*(?:us)?|about\s*(?:us|me)?|home|services?)$'
+    r'|still looking for'
+    r'|please email'
+    r'|looking for recommendations'
+    r'|^find\s'                  # "Find a Therapist..."
+    r'|^top \d+ best'            # "Top 10 Best Marriage Counseling..."
+    r'|^search\s+results'
+    r'|\.pdf$'                   # PDF filenames
+)
+
+
 class EmailPersonalizer:
     """Personalize email templates with lead data"""
 
@@ -530,29 +685,9 @@ class EmailPersonalizer:
         if '@' in c_lower:
             return True
 
-        # Looks like a date or page number
-        if re.match(r'^(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d', c_lower):
+        # Looks like a date or page number, or is scraped page furniture / navigation
+        if _GARBAGE_COMPANY_RE.search(c_lower):
             return True
-        if re.match(r'^\d{4}[-/]?\d{0,2}[-/]?\d{0,2}$', c_lower.strip()):
-            return True
-        if re.search(r'page \d+ of \d+', c_lower):
-            return True
-
-        # Scraped page furniture / navigation
-        garbage_patterns = [
-            r'(^|\s)contact\s*form',
-            r'^(archives|contact\s*(us)?|about\s*(us|me)?|home|services?)$',
-            r'still looking for',
-            r'please email',
-            r'looking for recommendations',
-            r'^find\s+(a\s+)?',        # "Find a Therapist..."
-            r'^top \d+ best',           # "Top 10 Best Marriage Counseling..."
-            r'^search\s+results',
-            r'\.pdf$',                  # PDF filenames
-        ]
-        for pattern in garbage_patterns:
-            if re.search(pattern, c_lower):
-                return True
 
         # Starts with common scraping artifacts
         if c_lower.startswith(('i am a ', 'we are ', 'looking for ', 'still looking')):
@@ -565,7 +700,7 @@ class EmailPersonalizer:
         return False
 
     @staticmethod
-    def personalize(template: str, lead) -> str:
+    def personalize(template: str, lead, values: Optional[Dict[str, str]] = None) -> str:
         """
         Replace template variables with lead data
 
@@ -585,7 +720,36 @@ class EmailPersonalizer:
 
         Fallback syntax: {variable|fallback} - uses fallback if variable is empty
         Example: {firstName|there} -> "Katie" if firstName exists, "there" if not
+
+        Pass `values` from template_values() to render several templates
+        (subject and body) for the same lead without rebuilding them.
         """
+        if values is None:
+            values = EmailPersonalizer.template_values(lead)
+
+        # Fill the pre-split slots: {variable|fallback} and {variable}
+        parts = _split_template(template)
+        out = [parts[0]]
+        for i in range(1, len(parts), 3):
+            var_name, fallback, text = parts[i:i + 3]
+            if fallback is not None:
+                out.append(values.get(var_name, '') or fallback)
+            else:
+                out.append(values.get(var_name, '{' + var_name + '}'))
+            out.append(text)
+        result = ''.join(out)
+
+        # Auto-fix blank first names in common greeting patterns
+        # "Hi ," -> "Hi there," | "Hello ," -> "Hello there,"
+        if not values['firstName']:
+            for pattern, replacement in _GREETING_FIXES:
+                result = pattern.sub(replacement, result)
+
+        return result
+
+    @staticmethod
+    def template_values(lead) -> Dict[str, str]:
+        """Build the template variable values for a lead"""
         from datetime import datetime, timedelta
 
         # Use the lead's saved personal deadline if it exists (set on first email).
@@ -651,27 +815,4 @@ class EmailPersonalizer:
             'deadline': deadline_str,
         }
 
-        result = template
-
-        # First handle fallback syntax: {variable|fallback}
-        fallback_pattern = re.compile(r'\{(\w+)\|([^}]+)\}')
-        def replace_with_fallback(match):
-            var_name = match.group(1)
-            fallback = match.group(2)
-            value = values.get(var_name, '')
-            return value if value else fallback
-
-        result = fallback_pattern.sub(replace_with_fallback, result)
-
-        # Then handle standard replacements
-        for var_name, value in values.items():
-            result = result.replace('{' + var_name + '}', value)
-
-        # Auto-fix blank first names in common greeting patterns
-        # "Hi ," -> "Hi there," | "Hello ," -> "Hello there,"
-        if not first_name:
-            result = re.sub(r'(Hi|Hello|Hey)\s*,', r'\1 there,', result)
-            result = re.sub(r'(Hi|Hello|Hey)\s*!', r'\1 there!', result)
-            result = re.sub(r'(Hi|Hello|Hey)\s*\n', r'\1 there\n', result)
-
-        return result
+        return values
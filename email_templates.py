@@ -2,6 +2,8 @@
 Multi-brand email wrapper. Derives branding from inbox email domain.
 """
 
+from functools import lru_cache
+
 from config import Config
 from unsubscribe import generate_unsubscribe_token
 
@@ -40,6 +42,48 @@ def build_unsubscribe_url(lead) -> str:
     return f"{base}/unsubscribe/{token}"
 
 
+@lru_cache(maxsize=None)
+def _html_shell(domain: str) -> tuple:
+    """Brand template split around the body and footer slots; built once per domain."""
+    brand = BRANDS.get(domain, DEFAULT_BRAND)
+    head = f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{brand["name"]}</title>
+</head>
+<body style="margin:0; padding:0; background-color:#ffffff;">
+    <table role="presentation" cellspacing="0" cellpadding="0" border="0" width="100%" style="background-color:#ffffff;">
+        <tr>
+            <td style="padding:32px 20px;">
+                <table role="presentation" cellspacing="0" cellpadding="0" border="0" width="640" style="margin:0 auto;">
+                    <tr>
+                        <td style="font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; font-size:15px; line-height:1.65; color:#1a1a1a;">
+                            '''
+    middle = f'''
+                        </td>
+                    </tr>
+                    <tr>
+                        <td style="padding-top:24px; border-top:1px solid #e6e6e6; font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; font-size:12px; line-height:1.5; color:#666666;">
+                            <div style="font-weight:600; color:#111111;">{brand["name"]}</div>
+                            <div style="margin-top:2px;">{brand["tagline"]}</div>
+                            <div style="margin-top:2px;">
+                                <a href="https://{brand["domain"]}" style="color:#111111; text-decoration:none;">{brand["domain"]}</a>
+                            </div>
+                            '''
+    tail = '''
+                        </td>
+                    </tr>
+                </table>
+            </td>
+        </tr>
+    </table>
+</body>
+</html>'''
+    return head, middle, tail
+
+
 def wrap_email_html(
     body_text: str,
     inbox_email: str,
@@ -76,43 +120,9 @@ def wrap_email_html(
         else:
             unsubscribe_html = 'If you prefer not to receive emails from us, reply with "unsubscribe".'
 
-    brand = get_brand(inbox_email)
-
-    html = f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{brand["name"]}</title>
-</head>
-<body style="margin:0; padding:0; background-color:#ffffff;">
-    <table role="presentation" cellspacing="0" cellpadding="0" border="0" width="100%" style="background-color:#ffffff;">
-        <tr>
-            <td style="padding:32px 20px;">
-                <table role="presentation" cellspacing="0" cellpadding="0" border="0" width="640" style="margin:0 auto;">
-                    <tr>
-                        <td style="font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; font-size:15px; line-height:1.65; color:#1a1a1a;">
-                            {body_html}
-                        </td>
-                    </tr>
-                    <tr>
-                        <td style="padding-top:24px; border-top:1px solid #e6e6e6; font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; font-size:12px; line-height:1.5; color:#666666;">
-                            <div style="font-weight:600; color:#111111;">{brand["name"]}</div>
-                            <div style="margin-top:2px;">{brand["tagline"]}</div>
-                            <div style="margin-top:2px;">
-                                <a href="https://{brand["domain"]}" style="color:#111111; text-decoration:none;">{brand["domain"]}</a>
-                            </div>
-                            {f'<div style="margin-top:8px;">{unsubscribe_html}</div>' if unsubscribe_html else ''}
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>'''
-
-    return html
+    head, middle, tail = _html_shell(inbox_email.split("@")[-1] if inbox_email else "")
+    footer = f'<div style="margin-top:8px;">{unsubscribe_html}</div>' if unsubscribe_html else ''
+    return f'{head}{body_html}{middle}{footer}{tail}'
 
 
 def get_plain_text_signature(inbox_email: str) -> str:
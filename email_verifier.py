@@ -6,11 +6,15 @@ Verifies emails just-in-time before sending to protect sender reputation.
 import os
 import logging
 import requests
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 logger = logging.getLogger(__name__)
 
 VERIFALIA_API_URL = "https://api.verifalia.com/v2.7/email-validations"
+DAILY_QUOTA = 25
+
+# A definitive result (anything but Unknown) is reused for this long before re-verifying
+VERIFICATION_MAX_AGE_DAYS = int(os.getenv('VERIFICATION_MAX_AGE_DAYS', '30'))
 
 
 class EmailVerifier:
@@ -20,6 +24,14 @@ class EmailVerifier:
         self.db_session = db_session
         self.username = os.getenv('VERIFALIA_USERNAME', '')
         self.password = os.getenv('VERIFALIA_PASSWORD', '')
+        # Keep-alive session: one TLS handshake for every lead verified in a run
+        self.http = requests.Session()
+        self.http.auth = (self.username, self.password)
+        # Per-run memo (email -> status) and remaining quota, so a lead in several
+        # campaigns, or a run past the quota, doesn't re-query per lead
+        self._results = {}
+        self._quota_remaining = None
+        self._quota_warned = False
 
     def _has_credentials(self) -> bool:
         return bool(self.username and self.password)
@@ -31,10 +43,23 @@ class EmailVerifier:
         Returns the classification: 'Deliverable', 'Undeliverable', 'Risky', 'Unknown', or 'Skipped'.
         Updates the lead record with verification results.
         """
-        # Already verified today - use cached result
-        if lead.email_verified_at and lead.email_verified_at.date() == date.today():
-            logger.debug(f"Using cached verification for {lead.email}: {lead.email_verification_status}")
-            return lead.email_verification_status or 'Unknown'
+        key = lead.email.lower()
+        if key not in self._results:
+            self._results[key] = self._verify(lead)
+        return self._results[key]
+
+    def _verify(self, lead) -> str:
+        """Verify one lead, reusing a recent stored result before spending quota."""
+        if lead.email_verified_at:
+            status = lead.email_verification_status
+            # Definitive results stay valid for weeks; Unknown is retried the next day
+            if status and status != 'Unknown':
+                fresh = datetime.utcnow() - lead.email_verified_at < timedelta(days=VERIFICATION_MAX_AGE_DAYS)
+            else:
+                fresh = lead.email_verified_at.date() == date.today()
+            if fresh:
+                logger.debug(f"Using cached verification for {lead.email}: {status}")
+                return status or 'Unknown'
 
         # Already permanently classified as undeliverable
         if lead.email_verification_status == 'Undeliverable':
@@ -44,17 +69,19 @@ class EmailVerifier:
             logger.warning("Verifalia credentials not configured, skipping verification")
             return 'Skipped'
 
-        # Check daily quota
+        # Check daily quota (warn once per run, not once per lead)
         if not self._has_quota_remaining():
-            from models import Lead
-            unverified = Lead.query.filter(
-                Lead.email_verified == False,
-                Lead.email_verification_status.is_(None)
-            ).count()
-            logger.warning(
-                f"Verifalia daily quota exhausted (25/day). "
-                f"{unverified} leads still unverified. Email will send unverified."
-            )
+            if not self._quota_warned:
+                from models import Lead
+                unverified = Lead.query.filter(
+                    Lead.email_verified == False,
+                    Lead.email_verification_status.is_(None)
+                ).count()
+                logger.warning(
+                    f"Verifalia daily quota exhausted ({DAILY_QUOTA}/day). "
+                    f"{unverified} leads still unverified. Email will send unverified."
+                )
+                self._quota_warned = True
             return 'Skipped'
 
         # Call Verifalia API
@@ -67,6 +94,7 @@ class EmailVerifier:
             if status == 'Deliverable':
                 lead.email_verified = True
             self.db_session.commit()
+            self._quota_remaining -= 1
 
             logger.info(f"Verified {lead.email}: {status}")
             return status
@@ -77,10 +105,9 @@ class EmailVerifier:
 
     def _call_verifalia(self, email: str) -> str:
         """Call Verifalia API to verify a single email. Returns classification string."""
-        resp = requests.post(
+        resp = self.http.post(
             f"{VERIFALIA_API_URL}?waitTime=30000",
             json={"entries": [{"inputData": email}]},
-            auth=(self.username, self.password),
             timeout=35,
         )
 
@@ -118,11 +145,7 @@ class EmailVerifier:
         url = f"{VERIFALIA_API_URL}/{job_id}?waitTime=10000"
 
         for _ in range(max_attempts):
-            resp = requests.get(
-                url,
-                auth=(self.username, self.password),
-                timeout=15,
-            )
+            resp = self.http.get(url, timeout=15)
             if resp.status_code == 200:
                 return self._extract_classification(resp.json())
             time.sleep(5)
@@ -140,18 +163,19 @@ class EmailVerifier:
             pass
         return 'Unknown'
 
-    def _has_quota_remaining(self) -> int:
-        """Check if we've used fewer than 25 verifications today."""
-        from models import Lead
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        verified_today = Lead.query.filter(
-            Lead.email_verified_at >= today_start,
-            Lead.email_verified_at.isnot(None),
-        ).count()
-        remaining = 25 - verified_today
-        if remaining <= 0:
+    def _has_quota_remaining(self) -> bool:
+        """Check if we've used fewer than 25 verifications today (counted once per run)."""
+        if self._quota_remaining is None:
+            from models import Lead
+            today_start = datetime.combine(date.today(), datetime.min.time())
+            verified_today = Lead.query.filter(
+                Lead.email_verified_at >= today_start,
+                Lead.email_verified_at.isnot(None),
+            ).count()
+            self._quota_remaining = max(DAILY_QUOTA - verified_today, 0)
+        if self._quota_remaining <= 0:
             return False
-        logger.debug(f"Verifalia quota: {remaining}/25 remaining today")
+        logger.debug(f"Verifalia quota: {self._quota_remaining}/{DAILY_QUOTA} remaining today")
         return True
 
     def should_send(self, status: str) -> bool:
@@ -24,28 +24,32 @@ def main():
     conn = sqlite3.connect(CRM_DB)
     cur = conn.cursor()
 
+    placeholders = ", ".join("?" * len(MALFORMED))
+
+    # One lookup for reporting, then set-based updates keyed by email
+    cur.execute(f"SELECT email, status FROM leads WHERE email IN ({placeholders})", MALFORMED)
+    found = dict(cur.fetchall())
     for email in MALFORMED:
-        cur.execute("SELECT id, email, status FROM leads WHERE email = ?", (email,))
-        row = cur.fetchone()
-        if row:
-            lead_id, lead_email, status = row
-            print(f"Found: id={lead_id} email={lead_email} status={status}")
-            if status != "bounced":
-                cur.execute("UPDATE leads SET status = 'bounced' WHERE id = ?", (lead_id,))
-                print(f"  -> Marked as bounced")
-            else:
-                print(f"  -> Already bounced, no change")
-
-            # Stop any active campaign_leads
-            cur.execute(
-                "UPDATE campaign_leads SET status = 'stopped' WHERE lead_id = ? AND status = 'active'",
-                (lead_id,),
-            )
-            stopped = cur.rowcount
-            if stopped:
-                print(f"  -> Stopped {stopped} active campaign(s)")
-        else:
+        if email not in found:
             print(f"Not found: {email}")
+        elif found[email] == "bounced":
+            print(f"Found: {email} -> Already bounced, no change")
+        else:
+            print(f"Found: {email} status={found[email]} -> Marked as bounced")
+
+    cur.execute(
+        f"UPDATE leads SET status = 'bounced' WHERE email IN ({placeholders}) AND (status IS NULL OR status != 'bounced')",
+        MALFORMED,
+    )
+
+    # Stop any active campaign_leads without a separate id lookup
+    cur.execute(
+        "UPDATE campaign_leads SET status = 'stopped' "
+        f"WHERE lead_id IN (SELECT id FROM leads WHERE email IN ({placeholders})) AND status = 'active'",
+        MALFORMED,
+    )
+    if cur.rowcount:
+        print(f"  -> Stopped {cur.rowcount} active campaign(s)")
 
     conn.commit()
     conn.close()
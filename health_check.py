@@ -19,11 +19,6 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 sys.path.insert(0, script_dir)
 
-from dotenv import load_dotenv
-load_dotenv()
-
-import requests
-
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -35,6 +30,7 @@ def check_openrouter_api_key():
         return False, "OPENROUTER_API_KEY is not set — AI auto-replies will fail silently"
     if len(key) < 20:
         return False, f"OPENROUTER_API_KEY looks invalid (length={len(key)})"
+    import requests
     try:
         resp = requests.get(
             "https://openrouter.ai/api/v1/models",
@@ -177,6 +173,7 @@ def _send_alert(message):
     chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
     if not token or not chat_id:
         return
+    import requests
     try:
         requests.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
@@ -249,6 +246,10 @@ if __name__ == "__main__":
     parser.add_argument('--warn', action='store_true', help='Warn only, do not abort on critical failure')
     args = parser.parse_args()
 
+    # Deferred past argument parsing so --help doesn't read .env or import the app
+    from dotenv import load_dotenv
+    load_dotenv()
+
     from app import app
     with app.app_context():
         exit_code = run_all_checks(warn_only=args.warn)
@@ -8,12 +8,14 @@ Commands:
     export      - Export bounced emails to CSV
     clean       - Delete old hard bounces (after review period)
     list        - List all bounced emails
+    watch       - Keep IMAP sessions open and process bounces as they arrive
 
 Usage:
     python manage_bounces.py check
     python manage_bounces.py report --days 30
     python manage_bounces.py export --file bounces.csv
     python manage_bounces.py clean --days 30 --dry-run
+    python manage_bounces.py watch --interval 300
 """
 
 import argparse
@@ -26,7 +28,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
 from models import db
-from bounce_handler import BounceProcessor, BounceCleaner, check_and_process_bounces
+from bounce_handler import BounceProcessor, BounceCleaner, check_and_process_bounces, watch_bounces
 
 
 def cmd_check(args):
@@ -139,24 +141,42 @@ def cmd_list(args):
     from models import Lead
     
     with app.app_context():
-        bounced = Lead.query.filter(
-            Lead.status.in_(['bounced', 'complained'])
-        ).order_by(Lead.updated_at.desc()).all()
+        cleaner = BounceCleaner(db.session)
+        
+        # Stream page by page; --quiet prints bare addresses for piping
+        if args.quiet:
+            for row in cleaner.iter_bounced_leads():
+                print(row.email)
+            return
         
-        if not bounced:
+        total = Lead.query.filter(Lead.status.in_(['bounced', 'complained'])).count()
+        if not total:
             print("✅ No bounced emails found.")
             return
         
-        print(f"\n📋 Bounced Emails ({len(bounced)} total):")
+        print(f"\n📋 Bounced Emails ({total} total):")
         print("-" * 80)
         print(f"{'Email':<40} {'Status':<12} {'Date':<20}")
         print("-" * 80)
         
-        for lead in bounced:
-            date_str = lead.updated_at.strftime('%Y-%m-%d') if lead.updated_at else 'Unknown'
-            print(f"{lead.email:<40} {lead.status:<12} {date_str:<20}")
-            if args.reason and lead.notes:
-                print(f"  └─ {lead.notes[:60]}...")
+        for row in cleaner.iter_bounced_leads():
+            date_str = row.updated_at.strftime('%Y-%m-%d') if row.updated_at else 'Unknown'
+            print(f"{row.email:<40} {row.status:<12} {date_str:<20}")
+            if args.reason and row.reason:
+                print(f"  └─ {row.reason[:60]}...")
+
+
+def cmd_watch(args):
+    """Watch all inboxes for bounces over long-lived IMAP connections"""
+    print(f"👀 Watching for bounces (polling every {args.interval}s, Ctrl+C to stop)...")
+    
+    try:
+        total = watch_bounces(app, db, poll_interval=args.interval)
+    except KeyboardInterrupt:
+        print("\nStopped.")
+        return
+    
+    print(f"✅ Processed {total} bounces")
 
 
 def main():
@@ -170,6 +190,7 @@ Examples:
   python manage_bounces.py list --reason            # List with reasons
   python manage_bounces.py export --file out.csv    # Export to CSV
   python manage_bounces.py clean --days 30 --dry-run # Preview cleanup
+  python manage_bounces.py watch                    # Run as a daemon
         """
     )
     
@@ -196,6 +217,12 @@ Examples:
     # list command
     list_parser = subparsers.add_parser('list', help='List all bounced emails')
     list_parser.add_argument('--reason', action='store_true', help='Show bounce reasons')
+    list_parser.add_argument('--quiet', action='store_true', help='Print one address per line, no table')
+    
+    # watch command
+    watch_parser = subparsers.add_parser('watch', help='Process bounces continuously')
+    watch_parser.add_argument('--interval', type=int, default=300,
+                              help='Seconds between folder checks (default: 300)')
     
     args = parser.parse_args()
     
@@ -210,6 +237,7 @@ Examples:
         'export': cmd_export,
         'clean': cmd_clean,
         'list': cmd_list,
+        'watch': cmd_watch,
     }
     
     commands[args.command](args)
@@ -9,6 +9,10 @@ db = SQLAlchemy()
 class Lead(db.Model):
     """Lead/Contact model"""
     __tablename__ = 'leads'
+    __table_args__ = (
+        db.Index('ix_leads_status_updated', 'status', 'updated_at'),  # bounce reports/cleanup
+        db.Index('ix_leads_email_lower', db.text('lower(email)')),  # case-insensitive lookups
+    )
 
     id = db.Column(Integer, primary_key=True)
     email = db.Column(String(255), unique=True, nullable=False, index=True)
@@ -100,6 +104,7 @@ class Campaign(db.Model):
     name = db.Column(String(255), nullable=False)
     inbox_id = db.Column(Integer, ForeignKey('inboxes.id'), nullable=False)
     status = db.Column(String(50), default='draft')  # draft, active, paused, completed
+    last_rotation_inbox_id = db.Column(Integer)  # rotation cursor: inbox of the last successful send
     created_at = db.Column(DateTime, default=datetime.utcnow)
     updated_at = db.Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -154,6 +159,10 @@ class Sequence(db.Model):
 class CampaignLead(db.Model):
     """Junction table tracking which leads are in which campaigns"""
     __tablename__ = 'campaign_leads'
+    __table_args__ = (
+        db.Index('ix_campaign_leads_lead_status', 'lead_id', 'status'),  # stop a lead's sequences
+        db.Index('ix_campaign_leads_campaign_status', 'campaign_id', 'status'),  # a campaign's active leads
+    )
 
     id = db.Column(Integer, primary_key=True)
     campaign_id = db.Column(Integer, ForeignKey('campaigns.id'), nullable=False)
@@ -172,6 +181,11 @@ class CampaignLead(db.Model):
 class SentEmail(db.Model):
     """Record of sent emails"""
     __tablename__ = 'sent_emails'
+    __table_args__ = (
+        db.Index('ix_sent_emails_lead_sent', 'lead_id', 'sent_at'),
+        db.Index('ix_sent_emails_status_sent', 'status', 'sent_at'),  # send caps/spike window
+        db.Index('ix_sent_emails_campaign_status_sent', 'campaign_id', 'status', 'sent_at'),  # per-campaign history
+    )
 
     id = db.Column(Integer, primary_key=True)
     lead_id = db.Column(Integer, ForeignKey('leads.id'), nullable=False)
@@ -200,6 +214,9 @@ class SentEmail(db.Model):
 class Response(db.Model):
     """Received email responses"""
     __tablename__ = 'responses'
+    __table_args__ = (
+        db.Index('ix_responses_lead', 'lead_id'),
+    )
 
     id = db.Column(Integer, primary_key=True)
     lead_id = db.Column(Integer, ForeignKey('leads.id'), nullable=False)
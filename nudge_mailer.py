@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the one-off nudge scripts (send_nudge_campaign.py,
+send_spot_closing_nudge.py): lead lookup, send tracker, SMTP session,
+sending and CRM recording. Each script keeps only its NUDGES list,
+password source and main().
+"""
+import os
+import sys
+import json
+import smtplib
+import ssl
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from dataclasses import dataclass
+from email.message import EmailMessage
+from email.utils import make_msgid
+from datetime import datetime
+from functools import lru_cache
+from types import SimpleNamespace
+
+# Add CRM to path for wrap_email_html
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'crm'))
+from email_templates import wrap_email_html, build_unsubscribe_url
+from email_handler import MESSAGE_POLICY, SMTP_POLICY
+
+# ─── Config ───
+SMTP_HOST = "mail.spacemail.com"
+SMTP_PORT = 465
+EMAIL_FROM = "hello@weddingcounselors.com"
+MSGID_DOMAIN = EMAIL_FROM.rpartition("@")[2]
+CRM_DB = os.path.join(os.path.dirname(__file__), "crm", "instance", "crm.db")
+SIGNATURE = "Sarah\nWedding Counselors Directory"
+
+_local = threading.local()
+
+
+def crm_connection():
+    """Return this thread's CRM connection, opened once and reused for the whole run."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = sqlite3.connect(CRM_DB)
+    return conn
+
+
+def get_smtp_password_from_crm():
+    """Pull SMTP password from CRM database."""
+    cur = crm_connection().cursor()
+    cur.execute("SELECT password FROM inboxes WHERE email = ?", (EMAIL_FROM,))
+    row = cur.fetchone()
+    return row[0] if row else ""
+
+
+_LEAD_CACHE = {}
+
+
+def get_lead_for_email(email_addr):
+    """Return minimal lead object for unsubscribe token generation."""
+    key = (email_addr or "").strip().lower()
+    if not key:
+        return None
+    if key in _LEAD_CACHE:
+        return _LEAD_CACHE[key]
+
+    try:
+        cur = crm_connection().cursor()
+        cur.execute(
+            "SELECT id, email FROM leads WHERE lower(email) = ? LIMIT 1",
+            (key,),
+        )
+        row = cur.fetchone()
+    except Exception:
+        row = None
+
+    lead = SimpleNamespace(id=row[0], email=row[1]) if row else None
+    _LEAD_CACHE[key] = lead
+    return lead
+
+
+def preload_leads(email_addrs):
+    """Fill the lead cache for every address in one query, so per-send lookups don't hit the DB."""
+    keys = {(addr or "").strip().lower() for addr in email_addrs} - set(_LEAD_CACHE) - {""}
+    if not keys:
+        return
+
+    try:
+        cur = crm_connection().cursor()
+        cur.execute(
+            f"SELECT lower(email), id, email FROM leads WHERE lower(email) IN ({', '.join('?' * len(keys))})",
+            tuple(keys),
+        )
+        rows = cur.fetchall()
+    except Exception:
+        # Leave the cache untouched; get_lead_for_email falls back to one query per address
+        return
+
+    found = {}
+    for key, lead_id, email in rows:
+        found.setdefault(key, SimpleNamespace(id=lead_id, email=email))
+    for key in keys:
+        _LEAD_CACHE[key] = found.get(key)
+
+
+@dataclass(frozen=True, slots=True)
+class Nudge:
+    """One hand-written nudge; render_body() adds the greeting and sign-off"""
+    to: str
+    name: str
+    subject: str
+    body: str
+
+    def __post_init__(self):
+        # Normalized once at import, so a body written as f"""\n...""" still renders cleanly
+        object.__setattr__(self, "body", self.body.strip())
+
+
+def render_body(nudge):
+    """Wrap a nudge's hand-written text in the shared greeting and sign-off."""
+    return f"Hi {nudge.name},\n\n{nudge.body}\n\n{SIGNATURE}"
+
+
+def load_tracker(path):
+    """Load send tracker from disk."""
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"sends": []}
+
+
+def save_tracker(tracker, path):
+    """Save send tracker to disk."""
+    with open(path, "w") as f:
+        json.dump(tracker, f, indent=2)
+
+
+SendContext = namedtuple("SendContext", "campaign_id sequence_id inbox_id")
+
+
+@lru_cache(maxsize=None)
+def crm_send_context():
+    """Active campaign, its first sequence and the sending inbox for SentEmail FKs; resolved once per run."""
+    cur = crm_connection().cursor()
+    cur.execute(
+        """SELECT c.id,
+                  (SELECT s.id FROM sequences s WHERE s.campaign_id = c.id LIMIT 1),
+                  (SELECT i.id FROM inboxes i WHERE i.email = ? LIMIT 1)
+           FROM campaigns c
+           WHERE c.status = 'active'
+             AND EXISTS (SELECT 1 FROM sequences s WHERE s.campaign_id = c.id)
+             AND EXISTS (SELECT 1 FROM inboxes i WHERE i.email = ?)
+           LIMIT 1""",
+        (EMAIL_FROM, EMAIL_FROM),
+    )
+    row = cur.fetchone()
+    return SendContext(*row) if row else None
+
+
+def record_sent_email_in_crm(lead_id, message_id, subject, body):
+    """Record the nudge send in the CRM database so replies can be properly tracked."""
+    try:
+        context = crm_send_context()
+        if context is None:
+            print("  WARNING: No active campaign with a sequence, or no inbox found — send not recorded in CRM")
+            return
+        conn = crm_connection()
+        conn.execute(
+            """INSERT INTO sent_emails (lead_id, campaign_id, sequence_id, inbox_id, message_id, subject, body, status, sent_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, 'sent', ?)""",
+            (lead_id, context.campaign_id, context.sequence_id, context.inbox_id,
+             message_id, subject, body, datetime.utcnow().isoformat()),
+        )
+        conn.commit()
+        print(f"  CRM: recorded SentEmail for lead {lead_id}")
+    except Exception as e:
+        print(f"  WARNING: Could not record in CRM: {e}")
+
+
+class SendPacer:
+    """Space sends `interval` seconds apart, sleeping only for what the previous send didn't already take."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last_start = None
+
+    def wait(self):
+        if self._last_start is not None:
+            remaining = self.interval - (time.monotonic() - self._last_start)
+            if remaining > 0:
+                time.sleep(remaining)
+        self._last_start = time.monotonic()
+
+
+def smtp_connect(password):
+    """Open and log in one SMTP SSL session; use as a context manager (quits on exit)."""
+    context = ssl.create_default_context()
+    server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=context)
+    try:
+        server.login(EMAIL_FROM, password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def send_email(to, subject, body, password, lead=None, dry_run=True, server=None, recorder=None):
+    """Send a single email via SMTP SSL, over `server` when the caller holds a session.
+
+    With `recorder` (an Executor) the CRM insert is submitted to it instead of
+    running inline, so the next send does not wait on the database write.
+    """
+    if dry_run:
+        print(f"\n{'='*60}")
+        print(f"TO:      {to}")
+        print(f"SUBJECT: {subject}")
+        print(f"{'─'*60}")
+        print(body)
+        print(f"{'='*60}")
+        return True
+
+    msg = EmailMessage(policy=SMTP_POLICY)
+    msg["From"] = f"Sarah <{EMAIL_FROM}>"
+    msg["To"] = to
+    msg["Subject"] = subject
+    message_id = make_msgid(domain=MSGID_DOMAIN)
+    msg["Message-ID"] = message_id
+
+    unsubscribe_url = build_unsubscribe_url(lead) if lead else None
+    if unsubscribe_url:
+        msg["List-Unsubscribe"] = f"<{unsubscribe_url}>, <mailto:{EMAIL_FROM}?subject=unsubscribe>"
+        msg["List-Unsubscribe-Post"] = "List-Unsubscribe=One-Click"
+    else:
+        msg["List-Unsubscribe"] = f"<mailto:{EMAIL_FROM}?subject=unsubscribe>"
+
+    # Plain text
+    msg.set_content(body)
+    # HTML version using CRM's professional template
+    html_body = wrap_email_html(body, EMAIL_FROM, lead=lead, include_unsubscribe=True)
+    msg.add_alternative(html_body, subtype="html")
+    msg.policy = MESSAGE_POLICY
+
+    try:
+        if server is None:
+            with smtp_connect(password) as server:
+                server.send_message(msg)
+        else:
+            # Log back in if the server dropped the idle session. Only checked before
+            # the send: a disconnect mid-send may follow an accepted message, so
+            # resending could duplicate it.
+            try:
+                alive = server.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                alive = False
+            if not alive:
+                server.close()
+                server.connect(SMTP_HOST, SMTP_PORT)
+                server.ehlo()
+                server.login(EMAIL_FROM, password)
+            server.send_message(msg)
+        print(f"  SENT to {to}")
+        # Record in CRM so reply detection works properly
+        if lead:
+            if recorder is None:
+                record_sent_email_in_crm(lead.id, message_id, subject, body)
+            else:
+                recorder.submit(record_sent_email_in_crm, lead.id, message_id, subject, body)
+        return True
+    except Exception as e:
+        print(f"  FAILED to {to}: {e}")
+        return False
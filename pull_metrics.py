@@ -1,24 +1,84 @@
 import requests, os
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+try:
+    import orjson  # encodes to / decodes from bytes directly, several times faster
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:
+    import json
+    loads = json.loads
+    def dumps(obj):
+        return json.dumps(obj).encode()
 load_dotenv()
-url = os.getenv('TURSO_DATABASE_URL', '').replace('libsql://', 'https://') + '/v2/pipeline'
-token = os.getenv('TURSO_AUTH_TOKEN')
+# Credentials come from the environment only; fail before any request is made
+try:
+    url = os.environ['TURSO_DATABASE_URL'].replace('libsql://', 'https://') + '/v2/pipeline'
+    token = os.environ['TURSO_AUTH_TOKEN']
+except KeyError as e:
+    raise SystemExit(f'{e.args[0]} is not set (export it or add it to .env)')
 h = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
 
-def q(sql):
-    r = requests.post(url, headers=h, json={'requests': [{'type':'execute','stmt':{'sql':sql}},{'type':'close'}]}, timeout=15)
-    res = r.json()['results'][0]['response']['result']
-    return [[c['value'] if c['type'] != 'null' else None for c in row] for row in res['rows']]
+# One keep-alive session so every query reuses the same TLS connection
+session = requests.Session()
+session.headers.update(h)
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+def arg(v):
+    """Encode a Python value as a typed Hrana bind argument."""
+    if v is None:
+        return {'type': 'null'}
+    if isinstance(v, (bool, int)):
+        return {'type': 'integer', 'value': str(int(v))}
+    if isinstance(v, float):
+        return {'type': 'float', 'value': v}
+    return {'type': 'text', 'value': str(v)}
+
+def rows(result):
+    """Materialize a Hrana result set as a list of value tuples (NULL -> None)."""
+    return [tuple([None if c['type'] == 'null' else c['value'] for c in row]) for row in result['rows']]
+
+def execute(sql, args=()):
+    return {'type': 'execute', 'stmt': {'sql': sql, 'args': [arg(a) for a in args]}}
+
+def pipeline(stmts):
+    """Run (sql, args) statements in one /v2/pipeline request; rows per statement, in order.
+
+    The statements share one transaction, so every count reads the same snapshot.
+    """
+    reqs = [execute(sql, args) for sql, args in stmts]
+    body = [execute('BEGIN')] + reqs + [execute('COMMIT'), {'type': 'close'}]
+    r = session.post(url, data=dumps({'requests': body}), timeout=15)
+    if r.status_code != 200:
+        raise RuntimeError(f'turso {r.status_code}: {r.text[:200]}')
+    results = loads(r.content)['results'][:len(reqs) + 2]
+    for result in results:
+        if result['type'] != 'ok':
+            raise RuntimeError(f"turso error: {result.get('error', {}).get('message', result)}")
+    return [rows(result['response']['result']) for result in results[1:-1]]
+
+# All nine queries share one HTTP round trip
+(status_rows, total_rows, sent_rows, emailed_rows, responses_rows,
+ responded_rows, responded_leads, bounced_leads, bounced_rows) = pipeline([
+    ('SELECT status, COUNT(*) FROM leads GROUP BY status ORDER BY COUNT(*) DESC', ()),
+    ('SELECT COUNT(*) FROM leads', ()),
+    ('SELECT COUNT(*) FROM sent_emails', ()),
+    ('SELECT COUNT(DISTINCT lead_id) FROM sent_emails', ()),
+    ('SELECT COUNT(*) FROM responses', ()),
+    ('SELECT COUNT(DISTINCT lead_id) FROM responses', ()),
+    ('SELECT l.id, l.first_name, l.last_name, l.status, l.email FROM leads l INNER JOIN (SELECT DISTINCT lead_id FROM responses) resp ON l.id = resp.lead_id ORDER BY l.id', ()),
+    ('SELECT id, first_name, last_name, status, email FROM leads WHERE status IN (?, ?) ORDER BY id', ('bounced', 'complained')),
+    ('SELECT COUNT(*) FROM leads WHERE status = ?', ('bounced',)),
+])
 
 print('=== LEAD STATUS BREAKDOWN ===')
-for r in q('SELECT status, COUNT(*) FROM leads GROUP BY status ORDER BY COUNT(*) DESC'):
+for r in status_rows:
     print(f'  {r[0]}: {r[1]}')
 
-total = q('SELECT COUNT(*) FROM leads')[0][0]
-sent = q('SELECT COUNT(*) FROM sent_emails')[0][0]
-unique_emailed = q('SELECT COUNT(DISTINCT lead_id) FROM sent_emails')[0][0]
-responses = q('SELECT COUNT(*) FROM responses')[0][0]
-unique_responded = q('SELECT COUNT(DISTINCT lead_id) FROM responses')[0][0]
+total = total_rows[0][0]
+sent = sent_rows[0][0]
+unique_emailed = emailed_rows[0][0]
+responses = responses_rows[0][0]
+unique_responded = responded_rows[0][0]
 
 print(f'\nTotal leads: {total}')
 print(f'Total emails sent: {sent}')
@@ -28,11 +88,11 @@ print(f'Unique leads who responded: {unique_responded}')
 print(f'Response rate: {int(unique_responded)/max(int(unique_emailed),1)*100:.1f}%')
 
 print('\n=== RESPONDED LEADS ===')
-for r in q('SELECT l.id, l.first_name, l.last_name, l.status, l.email FROM leads l INNER JOIN (SELECT DISTINCT lead_id FROM responses) resp ON l.id = resp.lead_id ORDER BY l.id'):
+for r in responded_leads:
     print(f'  #{r[0]} {r[1]} {r[2]} | {r[3]} | {r[4]}')
 
 print('\n=== BOUNCED / COMPLAINED ===')
-for r in q("SELECT id, first_name, last_name, status, email FROM leads WHERE status IN ('bounced','complained') ORDER BY id"):
+for r in bounced_leads:
     print(f'  #{r[0]} {r[1]} {r[2]} | {r[3]} | {r[4]}')
-bounced = q("SELECT COUNT(*) FROM leads WHERE status = 'bounced'")[0][0]
+bounced = bounced_rows[0][0]
 print(f'  Total bounced: {bounced}')
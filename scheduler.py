@@ -1,14 +1,53 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor as APSThreadPoolExecutor
 from apscheduler.triggers.interval import IntervalTrigger
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+from sqlalchemy import func, or_
+from sqlalchemy.orm import contains_eager
 import logging
 import os
+import re
 from config import Config
+from email_templates import wrap_email_html, build_unsubscribe_url
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bounce heuristics used per fetched response in check_responses
+_BOUNCE_SENDERS = ('mailer-daemon', 'postmaster', 'mail delivery subsystem')
+_BOUNCE_SUBJECTS = (
+    'undeliverable',
+    'delivery status notification',
+    'mail delivery failed',
+    'delivery failure',
+    'returned mail',
+    'failure notice',
+    'undelivered mail'
+)
+_BOUNCE_SENDER_RE = re.compile('|'.join(map(re.escape, _BOUNCE_SENDERS)))
+_BOUNCE_SUBJECT_RE = re.compile('|'.join(map(re.escape, _BOUNCE_SUBJECTS)))
+_EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+
+# Auto-label phrases after the out-of-office check, one alternation per label so a
+# single pass finds them all. "out of office" stays a separate substring test: in
+# "opt out of office" a shared alternation would consume "out" as part of "opt out".
+_LABEL_RE = re.compile(
+    r'(?P<unsubscribe>unsubscribe|remove me|opt out)'
+    r'|(?P<wrong_contact>wrong person|not the right person)'
+)
+
+# Inboxes fetched concurrently by check_responses
+IMAP_WORKERS = 16
+
+# Threads running scheduler jobs (send, response check and auto-reply can overlap)
+SCHEDULER_WORKERS = 4
+
+# Separate threads for the long-running AI jobs (auto-reply, prospecting), so
+# slow LLM and web calls never hold up sending or response checks
+AI_WORKERS = 2
+
 
 class EmailScheduler:
     """Background scheduler for email automation"""
@@ -16,16 +55,35 @@ class EmailScheduler:
     def __init__(self, app, db):
         self.app = app
         self.db = db
-        self.scheduler = BackgroundScheduler(timezone=Config.TIMEZONE)
+        # A tick that overruns (slow IMAP, SMTP backoff) must not overlap the next
+        # one, and ticks missed while busy collapse into a single catch-up run
+        self.scheduler = BackgroundScheduler(
+            executors={
+                'default': APSThreadPoolExecutor(SCHEDULER_WORKERS),
+                'ai': APSThreadPoolExecutor(AI_WORKERS),
+            },
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 300},
+            timezone=Config.TIMEZONE
+        )
+        # (batch target, slowest interval in minutes) of each adaptively polled job
+        self._poll_limits = {
+            'send_emails': (Config.SEND_BATCH_TARGET, Config.SEND_CHECK_INTERVAL_MAX_MINUTES),
+            'auto_reply': (Config.AUTO_REPLY_BATCH_TARGET, Config.AUTO_REPLY_INTERVAL_MAX_MINUTES),
+        }
+        # Current interval of each job, starting from the configured one
+        self._intervals = {
+            'send_emails': Config.SEND_CHECK_INTERVAL_MINUTES,
+            'auto_reply': Config.AUTO_REPLY_INTERVAL_MINUTES,
+        }
 
     def start(self):
         """Start the scheduler with all jobs"""
         logger.info("Starting email scheduler...")
 
-        # Job 1: Send scheduled emails every hour
+        # Job 1: Send scheduled emails (every hour to start; adapts to backlog)
         self.scheduler.add_job(
             func=self._send_scheduled_emails_job,
-            trigger=IntervalTrigger(minutes=Config.SEND_CHECK_INTERVAL_MINUTES),
+            trigger=IntervalTrigger(minutes=self._intervals['send_emails']),
             id='send_emails',
             name='Send scheduled emails',
             replace_existing=True
@@ -46,16 +104,18 @@ class EmailScheduler:
             trigger='cron',
             hour=2,
             minute=0,
+            jitter=60,  # instances sharing a database don't all clean up at the same second
             id='cleanup',
             name='Daily cleanup',
             replace_existing=True
         )
 
-        # Job 4: AI Auto-reply to responses every 15 minutes
+        # Job 4: AI Auto-reply to responses (every 15 minutes to start; adapts to volume)
         self.scheduler.add_job(
             func=self._auto_reply_job,
-            trigger=IntervalTrigger(minutes=15),
+            trigger=IntervalTrigger(minutes=self._intervals['auto_reply']),
             id='auto_reply',
+            executor='ai',
             name='AI auto-reply to responses',
             replace_existing=True
         )
@@ -67,6 +127,7 @@ class EmailScheduler:
             hour='9,15',  # Run at 9 AM and 3 PM
             minute=0,
             id='prospecting',
+            executor='ai',
             name='AI lead prospecting',
             replace_existing=True
         )
@@ -77,7 +138,30 @@ class EmailScheduler:
     def shutdown(self):
         """Shutdown the scheduler"""
         logger.info("Shutting down scheduler...")
-        self.scheduler.shutdown()
+        # Don't block process exit on a job mid-way through an IMAP/SMTP call
+        self.scheduler.shutdown(wait=False)
+
+    def _adapt_interval(self, job_id: str, processed: int):
+        """Halve a polling job's interval after a full batch, double it after a near-empty one
+
+        Response checks aren't adapted: backing off there would delay every reply.
+        """
+        target, max_interval = self._poll_limits[job_id]
+        current = self._intervals[job_id]
+        if processed >= target:
+            interval = current / 2
+        elif processed <= target / 4:
+            interval = current * 2
+        else:
+            return
+
+        interval = min(max(interval, Config.POLL_INTERVAL_MIN_MINUTES), max_interval)
+        if interval == current:
+            return
+
+        self._intervals[job_id] = interval
+        self.scheduler.reschedule_job(job_id, trigger=IntervalTrigger(minutes=interval))
+        logger.info(f"Job {job_id} now runs every {interval:g} minutes ({processed} processed last run)")
 
     def _send_scheduled_emails_job(self):
         """Job to send scheduled emails"""
@@ -86,6 +170,7 @@ class EmailScheduler:
                 logger.info("Running send_scheduled_emails job...")
                 count = self.send_scheduled_emails()
                 logger.info(f"Send job completed. Sent {count} emails.")
+                self._adapt_interval('send_emails', count)
             except Exception as e:
                 logger.error(f"Error in send_scheduled_emails job: {str(e)}")
 
@@ -108,6 +193,7 @@ class EmailScheduler:
                 responder = AutoReplyScheduler(self.app, self.db)
                 count = responder.process_pending_responses()
                 logger.info(f"Auto-reply job completed. Sent {count} AI-generated replies.")
+                self._adapt_interval('auto_reply', count)
             except Exception as e:
                 logger.error(f"Error in auto_reply job: {str(e)}")
 
@@ -141,6 +227,7 @@ class EmailScheduler:
         """
         from models import Campaign, CampaignLead, Lead, Sequence, SentEmail, Inbox
         from email_handler import EmailSender, EmailPersonalizer, RateLimiter
+        from email_verifier import EmailVerifier
 
         sent_count = 0
         now_local = datetime.now(ZoneInfo(Config.TIMEZONE))
@@ -163,46 +250,73 @@ class EmailScheduler:
             logger.info(f"Daily send cap reached ({sent_today}/{daily_cap}). Stopping.")
             return 0
 
-        # Get all active campaigns
+        # One verifier (and its keep-alive HTTP session) for the whole run
+        verifier = EmailVerifier(self.db.session)
+
+        # Sending schedules and last-hour send counts for every inbox, loaded once
+        schedule_map = self._get_schedule_map()
+        sent_last_hour = RateLimiter(self.db.session).get_hourly_counts()
+
+        # Get all active campaigns, and their active sequences in one query.
+        # Both are re-read every run: campaign status is flipped by the spike
+        # guard, the agent and admin scripts, so a cross-run cache could keep
+        # sending for a paused campaign.
         active_campaigns = Campaign.query.filter_by(status='active').all()
+        sequences_by_campaign = {}
+        if active_campaigns:
+            for sequence in Sequence.query.filter(
+                Sequence.campaign_id.in_([c.id for c in active_campaigns]),
+                Sequence.active == True
+            ).order_by(Sequence.campaign_id, Sequence.step_number):
+                sequences_by_campaign.setdefault(sequence.campaign_id, []).append(sequence)
 
         for campaign in active_campaigns:
             try:
-                # Get campaign leads that are active
-                campaign_leads = CampaignLead.query.filter_by(
-                    campaign_id=campaign.id,
-                    status='active'
-                ).all()
+                inboxes = self._get_rotation_pool_inboxes(campaign)
+                if not inboxes:
+                    continue
+
+                sequences = sequences_by_campaign.get(campaign.id)
+                if not sequences:
+                    continue
+
+                # Active campaign leads with their lead rows in one query,
+                # skipping leads that have responded
+                campaign_leads = CampaignLead.query.join(CampaignLead.lead).filter(
+                    CampaignLead.campaign_id == campaign.id,
+                    CampaignLead.status == 'active',
+                    or_(Lead.status.is_(None),
+                        Lead.status.notin_(('responded', 'meeting_booked', 'not_interested', 'unsubscribed')))
+                ).options(contains_eager(CampaignLead.lead)).all()
+
+                sent_history = self._get_sent_history(campaign.id)
 
                 for campaign_lead in campaign_leads:
                     lead = campaign_lead.lead
-
-                    # Skip if lead has responded
-                    if lead.status in ('responded', 'meeting_booked', 'not_interested', 'unsubscribed'):
-                        continue
+                    sent_sequence_ids, last_sent_at = sent_history.get(lead.id, ((), None))
 
                     # Find next sequence step to send
-                    next_sequence = self._get_next_sequence_for_lead(lead.id, campaign.id)
+                    next_sequence = self._get_next_sequence_for_lead(sequences, sent_sequence_ids)
 
                     if not next_sequence:
                         continue
 
                     # Check if it's time to send this sequence
-                    if not self._is_sequence_due(lead.id, campaign.id, next_sequence):
+                    if not self._is_sequence_due(next_sequence, last_sent_at):
                         continue
 
-                    selected_inbox, max_per_hour = self._select_inbox_for_campaign(campaign, now_local)
+                    selected_inbox, max_per_hour = self._select_inbox_for_campaign(
+                        campaign, inboxes, now_local, schedule_map, sent_last_hour
+                    )
                     if not selected_inbox:
                         continue
 
                     # Verify email before sending (Verifalia - 25 free/day)
-                    from email_verifier import EmailVerifier
-                    verifier = EmailVerifier(self.db.session)
                     verification_status = verifier.verify_email(lead)
                     if not verifier.should_send(verification_status):
                         logger.warning(f"Skipping {lead.email}: verification={verification_status}")
+                        # Rides along with the next send's commit (or the one at the end of the run)
                         campaign_lead.status = 'stopped'
-                        self.db.session.commit()
                         continue
 
                     # Send the email
@@ -210,21 +324,18 @@ class EmailScheduler:
 
                     if success:
                         sent_count += 1
+                        sent_last_hour[selected_inbox.id] = sent_last_hour.get(selected_inbox.id, 0) + 1
 
                         # Stop if we've hit the daily cap this run
                         if sent_today + sent_count >= daily_cap:
                             logger.info(f"Daily send cap reached ({sent_today + sent_count}/{daily_cap}). Stopping.")
                             return sent_count
 
-                        # Update lead status
-                        if lead.status == 'new':
-                            lead.status = 'contacted'
-                            self.db.session.commit()
-
             except Exception as e:
                 logger.error(f"Error processing campaign {campaign.id}: {str(e)}")
                 continue
 
+        self.db.session.commit()
         return sent_count
 
     def _should_pause_on_spike(self) -> bool:
@@ -232,23 +343,18 @@ class EmailScheduler:
         from models import SentEmail
 
         window_start = datetime.utcnow() - timedelta(minutes=Config.SPIKE_WINDOW_MINUTES)
-        total_sent = SentEmail.query.filter(
+        # All three counts for the window in one round trip
+        counts = dict(self.db.session.query(SentEmail.status, func.count()).filter(
             SentEmail.sent_at >= window_start,
-            SentEmail.status == 'sent'
-        ).count()
+            SentEmail.status.in_(('sent', 'bounced', 'failed'))
+        ).group_by(SentEmail.status).all())
 
+        total_sent = counts.get('sent', 0)
         if total_sent == 0:
             return False
 
-        bounced = SentEmail.query.filter(
-            SentEmail.sent_at >= window_start,
-            SentEmail.status == 'bounced'
-        ).count()
-
-        failed = SentEmail.query.filter(
-            SentEmail.sent_at >= window_start,
-            SentEmail.status == 'failed'
-        ).count()
+        bounced = counts.get('bounced', 0)
+        failed = counts.get('failed', 0)
 
         bounce_rate = bounced / total_sent * 100
         failure_rate = failed / total_sent * 100
@@ -268,13 +374,20 @@ class EmailScheduler:
         self.db.session.commit()
         return True
 
-    def _get_inbox_schedule_limit(self, inbox, now_local: datetime) -> tuple[bool, int]:
-        """Return whether inbox can send now and the max_per_hour to use."""
+    def _get_schedule_map(self) -> dict:
+        """Map inbox_id -> {hour_of_day: SendingSchedule} for every inbox in one query"""
         from models import SendingSchedule
 
-        schedules = SendingSchedule.query.filter_by(inbox_id=inbox.id).all()
+        schedule_map = {}
+        for schedule in SendingSchedule.query.all():
+            schedule_map.setdefault(schedule.inbox_id, {})[schedule.hour_of_day] = schedule
+        return schedule_map
+
+    def _get_inbox_schedule_limit(self, inbox, now_local: datetime, schedule_map: dict) -> tuple[bool, int]:
+        """Return whether inbox can send now and the max_per_hour to use."""
+        schedules = schedule_map.get(inbox.id)
         if schedules:
-            hour_row = next((s for s in schedules if s.hour_of_day == now_local.hour), None)
+            hour_row = schedules.get(now_local.hour)
             if not hour_row or not hour_row.active:
                 return False, inbox.max_per_hour
             return True, hour_row.max_per_hour or inbox.max_per_hour
@@ -294,91 +407,84 @@ class EmailScheduler:
 
         return sorted(inboxes, key=lambda i: i.id)
 
-    def _select_inbox_for_campaign(self, campaign, now_local: datetime):
-        """Pick an inbox using rotation + schedule + rate limits."""
+    def _select_inbox_for_campaign(self, campaign, inboxes, now_local: datetime,
+                                   schedule_map: dict, sent_last_hour: dict):
+        """Pick an inbox from the campaign's pool using rotation + schedule + rate limits."""
         from models import SentEmail
-        from email_handler import RateLimiter
-
-        inboxes = self._get_rotation_pool_inboxes(campaign)
-        if not inboxes:
-            return None, None
 
-        last_sent = SentEmail.query.filter_by(
-            campaign_id=campaign.id,
-            status='sent'
-        ).order_by(SentEmail.sent_at.desc()).first()
+        # The cursor is kept on the campaign; only a campaign that has never
+        # recorded one falls back to looking up its last send
+        last_inbox_id = campaign.last_rotation_inbox_id
+        if last_inbox_id is None:
+            last_sent = SentEmail.query.filter_by(
+                campaign_id=campaign.id,
+                status='sent'
+            ).order_by(SentEmail.sent_at.desc()).first()
+            last_inbox_id = last_sent.inbox_id if last_sent else None
 
         start_index = 0
-        if last_sent:
+        if last_inbox_id is not None:
             for idx, inbox in enumerate(inboxes):
-                if inbox.id == last_sent.inbox_id:
+                if inbox.id == last_inbox_id:
                     start_index = (idx + 1) % len(inboxes)
                     break
 
         ordered = inboxes[start_index:] + inboxes[:start_index]
-        rate_limiter = RateLimiter(self.db.session)
 
         for inbox in ordered:
-            within_window, max_per_hour = self._get_inbox_schedule_limit(inbox, now_local)
+            within_window, max_per_hour = self._get_inbox_schedule_limit(inbox, now_local, schedule_map)
             if not within_window:
                 continue
-            if not rate_limiter.can_send(inbox.id, max_per_hour):
+            if sent_last_hour.get(inbox.id, 0) >= max_per_hour:
                 logger.info(f"Rate limit reached for inbox {inbox.email}")
                 continue
             return inbox, max_per_hour
 
         return None, None
 
-    def _get_next_sequence_for_lead(self, lead_id: int, campaign_id: int):
-        """Get the next sequence step that should be sent to this lead"""
-        from models import Sequence, SentEmail
-
-        # Get all sequences for this campaign, ordered by step
-        sequences = Sequence.query.filter_by(
-            campaign_id=campaign_id,
-            active=True
-        ).order_by(Sequence.step_number).all()
-
-        if not sequences:
-            return None
-
-        # Get all sent emails for this lead in this campaign
-        sent_steps = self.db.session.query(SentEmail.sequence_id).filter_by(
-            lead_id=lead_id,
-            campaign_id=campaign_id,
-            status='sent'
-        ).all()
-
-        sent_sequence_ids = [s[0] for s in sent_steps]
+    def _get_sent_history(self, campaign_id: int) -> dict:
+        """Map lead_id -> (sent sequence ids, last sent_at) for a campaign in one query"""
+        from models import SentEmail
 
-        # Find first sequence not yet sent
+        rows = self.db.session.query(
+            SentEmail.lead_id,
+            SentEmail.sequence_id,
+            func.max(SentEmail.sent_at)
+        ).filter(
+            SentEmail.campaign_id == campaign_id,
+            SentEmail.status == 'sent'
+        ).group_by(SentEmail.lead_id, SentEmail.sequence_id).all()
+
+        history = {}
+        for lead_id, sequence_id, sent_at in rows:
+            sequence_ids, last_sent_at = history.get(lead_id, (set(), None))
+            sequence_ids.add(sequence_id)
+            if last_sent_at is None or sent_at > last_sent_at:
+                last_sent_at = sent_at
+            history[lead_id] = (sequence_ids, last_sent_at)
+        return history
+
+    def _get_next_sequence_for_lead(self, sequences, sent_sequence_ids):
+        """Get the next sequence step that should be sent to this lead"""
+        # Find first sequence (ordered by step) not yet sent
         for sequence in sequences:
             if sequence.id not in sent_sequence_ids:
                 return sequence
 
         return None
 
-    def _is_sequence_due(self, lead_id: int, campaign_id: int, sequence) -> bool:
-        """Check if this sequence step is due to be sent"""
-        from models import SentEmail
-
+    def _is_sequence_due(self, sequence, last_sent_at) -> bool:
+        """Check if this sequence step is due, given the lead's last send in the campaign"""
         # If it's the first step (delay_days = 0), it's always due
         if sequence.step_number == 1:
             return True
 
-        # Get the last sent email in this campaign for this lead
-        last_sent = SentEmail.query.filter_by(
-            lead_id=lead_id,
-            campaign_id=campaign_id,
-            status='sent'
-        ).order_by(SentEmail.sent_at.desc()).first()
-
-        if not last_sent:
+        if not last_sent_at:
             # No previous email, so first step is due
             return sequence.step_number == 1
 
         # Check if enough days have passed
-        days_since_last = (datetime.utcnow() - last_sent.sent_at).days
+        days_since_last = (datetime.utcnow() - last_sent_at).days
 
         return days_since_last >= sequence.delay_days
 
@@ -386,12 +492,12 @@ class EmailScheduler:
         """Send a specific sequence email to a lead"""
         from models import SentEmail
         from email_handler import EmailSender, EmailPersonalizer
-        from email_templates import wrap_email_html, build_unsubscribe_url
 
         try:
             # Personalize subject and body
-            subject = EmailPersonalizer.personalize(sequence.subject_template, lead)
-            body = EmailPersonalizer.personalize(sequence.email_template, lead)
+            values = EmailPersonalizer.template_values(lead)
+            subject = EmailPersonalizer.personalize(sequence.subject_template, lead, values)
+            body = EmailPersonalizer.personalize(sequence.email_template, lead, values)
 
             # Wrap in professional HTML template with staff signature
             body_html = wrap_email_html(body, inbox.email, lead=lead)
@@ -423,6 +529,12 @@ class EmailScheduler:
             )
 
             self.db.session.add(sent_email)
+
+            # Lead status change and rotation cursor ride in the same transaction as the SentEmail row
+            if success:
+                campaign.last_rotation_inbox_id = inbox.id
+                if lead.status == 'new':
+                    lead.status = 'contacted'
             self.db.session.commit()
 
             if success:
@@ -443,109 +555,111 @@ class EmailScheduler:
 
         Returns: number of new responses found
         """
-        from models import Inbox, Response, SentEmail, Lead
+        from models import Inbox, Response, SentEmail, Lead, CampaignLead
         from email_handler import EmailReceiver
 
         response_count = 0
 
         # Get all active inboxes
         inboxes = Inbox.query.filter_by(active=True).all()
+        if not inboxes:
+            return 0
+
+        # IMAP fetches are network-bound and independent per inbox, so they run
+        # concurrently; results are recorded here on this thread's session.
+        # Receivers are built up front so worker threads never touch the ORM.
+        with ThreadPoolExecutor(max_workers=min(IMAP_WORKERS, len(inboxes))) as pool:
+            futures = {
+                pool.submit(EmailReceiver(inbox).fetch_new_responses): inbox
+                for inbox in inboxes
+            }
+            for future in as_completed(futures):
+                inbox = futures[future]
+                try:
+                    responses = future.result()
+
+                    for resp in responses:
+                        if self._is_bounce_message(resp):
+                            sent_email = self._match_sent_email(resp)
+                            if sent_email and sent_email.status != 'bounced':
+                                sent_email.status = 'bounced'
+                                sent_email.error_message = 'Bounce detected from inbox'
+                                self.db.session.commit()
+                                logger.warning(f"Marked bounced email for {sent_email.lead.email}")
+                            continue
+
+                        # Try to match response to sent email (In-Reply-To, then References)
+                        sent_email = self._match_sent_email(resp)
+
+                        # Extract email address from 'From' header
+                        from_email = self._extract_email(resp['from'])
+
+                        # Find lead by email
+                        lead = Lead.query.filter_by(email=from_email).first()
+
+                        if not lead and sent_email:
+                            lead = sent_email.lead
+
+                        if lead:
+                            label = self._auto_label_response(resp)
+
+                            # Save response
+                            response = Response(
+                                lead_id=lead.id,
+                                sent_email_id=sent_email.id if sent_email else None,
+                                message_id=resp['message_id'],
+                                in_reply_to=resp['in_reply_to'],
+                                subject=resp['subject'],
+                                body=resp['body'],
+                                received_at=resp['date'],
+                                label=label
+                            )
+
+                            self.db.session.add(response)
+
+                            # Update lead status
+                            if label == 'unsubscribe':
+                                lead.status = 'not_interested'
+                            elif lead.status != 'meeting_booked':
+                                lead.status = 'responded'
+
+                            # Stop further sequences for this lead in all campaigns
+                            CampaignLead.query.filter_by(lead_id=lead.id, status='active').update(
+                                {'status': 'completed'}, synchronize_session=False
+                            )
 
-        for inbox in inboxes:
-            try:
-                receiver = EmailReceiver(inbox)
-                responses = receiver.fetch_new_responses()
-
-                for resp in responses:
-                    if self._is_bounce_message(resp):
-                        sent_email = self._match_bounce_to_sent_email(resp)
-                        if sent_email and sent_email.status != 'bounced':
-                            sent_email.status = 'bounced'
-                            sent_email.error_message = 'Bounce detected from inbox'
                             self.db.session.commit()
-                            logger.warning(f"Marked bounced email for {sent_email.lead.email}")
-                        continue
+                            response_count += 1
 
-                    # Try to match response to sent email
-                    sent_email = None
-
-                    if resp['in_reply_to']:
-                        sent_email = SentEmail.query.filter_by(
-                            message_id=resp['in_reply_to']
-                        ).first()
-
-                    # If not found by In-Reply-To, try References header
-                    if not sent_email and resp['references']:
-                        ref_ids = resp['references'].split()
-                        for ref_id in ref_ids:
-                            ref_id = ref_id.strip('<>')
-                            sent_email = SentEmail.query.filter_by(
-                                message_id=ref_id
-                            ).first()
-                            if sent_email:
-                                break
-
-                    # Extract email address from 'From' header
-                    from_email = self._extract_email(resp['from'])
-
-                    # Find lead by email
-                    lead = Lead.query.filter_by(email=from_email).first()
-
-                    if not lead and sent_email:
-                        lead = sent_email.lead
-
-                    if lead:
-                        label = self._auto_label_response(resp)
-
-                        # Save response
-                        response = Response(
-                            lead_id=lead.id,
-                            sent_email_id=sent_email.id if sent_email else None,
-                            message_id=resp['message_id'],
-                            in_reply_to=resp['in_reply_to'],
-                            subject=resp['subject'],
-                            body=resp['body'],
-                            received_at=resp['date'],
-                            label=label
-                        )
-
-                        self.db.session.add(response)
-
-                        # Update lead status
-                        if label == 'unsubscribe':
-                            lead.status = 'not_interested'
-                        elif lead.status != 'meeting_booked':
-                            lead.status = 'responded'
-
-                        # Stop further sequences for this lead in all campaigns
-                        from models import CampaignLead
-                        campaign_leads = CampaignLead.query.filter_by(lead_id=lead.id).all()
-                        for cl in campaign_leads:
-                            if cl.status == 'active':
-                                cl.status = 'completed'
-
-                        self.db.session.commit()
-                        response_count += 1
-
-                        logger.info(f"Recorded response from {lead.email}")
+                            logger.info(f"Recorded response from {lead.email}")
 
-            except Exception as e:
-                logger.error(f"Error checking responses for inbox {inbox.email}: {str(e)}")
-                self.db.session.rollback()
-                continue
+                except Exception as e:
+                    logger.error(f"Error checking responses for inbox {inbox.email}: {str(e)}")
+                    self.db.session.rollback()
+                    continue
 
         return response_count
 
+    def _lowercased(self, resp: dict) -> 'tuple[str, str]':
+        """Lowercase subject and body once per response; bounce and label checks share them."""
+        if '_body_lc' not in resp:
+            resp['_subject_lc'] = (resp.get('subject') or '').lower()
+            resp['_body_lc'] = (resp.get('body') or '').lower()
+        return resp['_subject_lc'], resp['_body_lc']
+
     def _auto_label_response(self, resp: dict) -> 'str | None':
         """Apply a simple label based on common keywords."""
-        subject = (resp.get('subject') or '').lower()
-        body = (resp.get('body') or '').lower()
+        subject, body = self._lowercased(resp)
 
         if "out of office" in subject or "out of office" in body:
             return "out_of_office"
-        if "unsubscribe" in body or "remove me" in body or "opt out" in body:
+
+        found = {match.lastgroup for match in _LABEL_RE.finditer(body)}
+
+        # Same precedence as the label order above
+        if "unsubscribe" in found:
             return "unsubscribe"
-        if "wrong person" in body or "not the right person" in body:
+        if "wrong_contact" in found:
             return "wrong_contact"
 
         return None
@@ -553,51 +667,43 @@ class EmailScheduler:
     def _is_bounce_message(self, resp: dict) -> bool:
         """Heuristic bounce detection based on sender/subject/body."""
         from_header = (resp.get('from') or '').lower()
-        subject = (resp.get('subject') or '').lower()
-        body = (resp.get('body') or '').lower()
-
-        bounce_senders = ('mailer-daemon', 'postmaster', 'mail delivery subsystem')
-        bounce_subjects = (
-            'undeliverable',
-            'delivery status notification',
-            'mail delivery failed',
-            'delivery failure',
-            'returned mail',
-            'failure notice',
-            'undelivered mail'
-        )
+        subject, body = self._lowercased(resp)
 
-        if any(s in from_header for s in bounce_senders):
+        if _BOUNCE_SENDER_RE.search(from_header):
             return True
-        if any(s in subject for s in bounce_subjects):
+        if _BOUNCE_SUBJECT_RE.search(subject):
             return True
         if 'diagnostic-code' in body and 'delivery' in body:
             return True
 
         return False
 
-    def _match_bounce_to_sent_email(self, resp: dict):
-        """Match a bounce to a SentEmail via headers or references."""
+    def _match_sent_email(self, resp: dict):
+        """Match a response or bounce to a SentEmail via headers or references."""
         from models import SentEmail
 
+        # Candidate Message-IDs in priority order, resolved with one IN query
+        candidates = []
         if resp.get('in_reply_to'):
-            sent_email = SentEmail.query.filter_by(message_id=resp['in_reply_to']).first()
-            if sent_email:
-                return sent_email
-
+            candidates.append(resp['in_reply_to'])
         references = resp.get('references') or ''
-        for ref_id in references.split():
-            ref_id = ref_id.strip('<>')
-            sent_email = SentEmail.query.filter_by(message_id=ref_id).first()
-            if sent_email:
-                return sent_email
+        candidates.extend(ref_id.strip('<>') for ref_id in references.split())
+        if not candidates:
+            return None
+
+        by_message_id = {
+            sent_email.message_id: sent_email
+            for sent_email in SentEmail.query.filter(SentEmail.message_id.in_(candidates)).all()
+        }
+        for message_id in candidates:
+            if message_id in by_message_id:
+                return by_message_id[message_id]
 
         return None
 
     def _extract_email(self, from_header: str) -> str:
         """Extract email address from From header"""
-        import re
-        match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', from_header)
+        match = _EMAIL_RE.search(from_header)
         return match.group(0) if match else from_header
 
     def cleanup_old_data(self):
@@ -38,6 +38,7 @@ logger = logging.getLogger(__name__)
 
 from app import app
 from models import db, Campaign, Sequence, CampaignLead, Lead, SentEmail
+from sqlalchemy import func, insert
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -402,13 +403,17 @@ def redistribute_leads(campaign_ids, dry_run=False):
                 print("  ERROR: Need at least 2 real campaign IDs to redistribute.")
             return
 
-        # Check if leads are ALREADY distributed (idempotency)
-        existing_distribution = {}
-        for cid in real_ids:
-            count = CampaignLead.query.filter_by(
-                campaign_id=cid, status='active'
-            ).count()
-            existing_distribution[cid] = count
+        # Check if leads are ALREADY distributed (idempotency) — one grouped count for all variants
+        active_counts = dict(
+            db.session.query(CampaignLead.campaign_id, func.count(CampaignLead.id)).filter(
+                CampaignLead.campaign_id.in_(real_ids),
+                CampaignLead.status == 'active'
+            ).group_by(CampaignLead.campaign_id).all()
+        )
+        existing_distribution = {cid: active_counts.get(cid, 0) for cid in real_ids}
+        campaign_names = dict(
+            db.session.query(Campaign.id, Campaign.name).filter(Campaign.id.in_(real_ids)).all()
+        )
 
         all_have_leads = all(c > 0 for c in existing_distribution.values())
         total_assigned = sum(existing_distribution.values())
@@ -419,8 +424,7 @@ def redistribute_leads(campaign_ids, dry_run=False):
             if min_count >= max_count * 0.7:
                 print(f"\nLeads already distributed across all campaigns:")
                 for cid, count in existing_distribution.items():
-                    campaign = Campaign.query.get(cid)
-                    print(f"  {campaign.name} (ID={cid}): {count} active leads")
+                    print(f"  {campaign_names[cid]} (ID={cid}): {count} active leads")
                 print(f"  Distribution is balanced (min={min_count}, max={max_count}). Skipping redistribution.")
                 return
 
@@ -436,10 +440,8 @@ def redistribute_leads(campaign_ids, dry_run=False):
         if not untouched:
             print("No untouched leads to redistribute.")
             print("\nCurrent lead distribution:")
-            for cid in real_ids:
-                campaign = Campaign.query.get(cid)
-                active = CampaignLead.query.filter_by(campaign_id=cid, status='active').count()
-                print(f"  {campaign.name} (ID={cid}): {active} active leads")
+            for cid, count in existing_distribution.items():
+                print(f"  {campaign_names[cid]} (ID={cid}): {count} active leads")
             return
 
         random.shuffle(untouched)
@@ -453,8 +455,7 @@ def redistribute_leads(campaign_ids, dry_run=False):
         if dry_run:
             for i, cid in enumerate(real_ids):
                 count = per_variant + (1 if i < remainder else 0)
-                campaign = Campaign.query.get(cid)
-                name = campaign.name if campaign else f"Campaign {cid}"
+                name = campaign_names.get(cid, f"Campaign {cid}")
                 print(f"  [DRY RUN] {name}: would get {count} leads")
             print(f"\n  Total: {len(untouched)} leads would be redistributed")
             return
@@ -467,28 +468,27 @@ def redistribute_leads(campaign_ids, dry_run=False):
         if removed:
             print(f"Removed {removed} existing CampaignLead assignments for untouched leads")
 
-        # Round-robin assign
+        # Round-robin assign; the links go out as one bulk INSERT in the same transaction as the delete
         assigned = {cid: 0 for cid in real_ids}
-        for i, lead in enumerate(untouched):
+        new_links = []
+        for i, lead_id in enumerate(untouched_ids):
             target_campaign_id = real_ids[i % len(real_ids)]
-            cl = CampaignLead(
-                campaign_id=target_campaign_id,
-                lead_id=lead.id,
-                status='active',
-            )
-            db.session.add(cl)
+            new_links.append({
+                'campaign_id': target_campaign_id,
+                'lead_id': lead_id,
+                'status': 'active',
+            })
             assigned[target_campaign_id] += 1
 
+        db.session.execute(insert(CampaignLead), new_links)
         db.session.commit()
 
         print("\nAssignment complete:")
         for cid, count in assigned.items():
-            campaign = Campaign.query.get(cid)
-            print(f"  {campaign.name} (ID={cid}): {count} leads")
+            print(f"  {campaign_names[cid]} (ID={cid}): {count} leads")
         print(f"  Total: {sum(assigned.values())} leads redistributed")
 
         # Verify no duplicates
-        from sqlalchemy import func
         multi = db.session.query(
             CampaignLead.lead_id, func.count(CampaignLead.campaign_id)
         ).filter(
@@ -26,9 +26,14 @@ inboxes = [
 ]
 
 with app.app_context():
+    # Look up every inbox that already exists in one query
+    existing_map = {
+        inbox.email: inbox
+        for inbox in Inbox.query.filter(Inbox.email.in_([i["email"] for i in inboxes])).all()
+    }
+
     for inbox_data in inboxes:
-        # Check if exists
-        existing = Inbox.query.filter_by(email=inbox_data["email"]).first()
+        existing = existing_map.get(inbox_data["email"])
         if existing:
             print(f"Updating: {inbox_data['email']}")
             existing.username = inbox_data["username"]
@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
 from models import db, Inbox, Campaign, Sequence, Lead, CampaignLead
+from sqlalchemy.orm import joinedload
 
 # === CONFIGURATION - UPDATE PASSWORD BELOW ===
 EMAIL_PASSWORD = os.environ.get("WEDDING_EMAIL_PASSWORD", "")  # Set via environment variable
@@ -131,20 +132,22 @@ def setup():
                 inbox.max_per_hour = INBOX_CONFIG["max_per_hour"]
                 updated = True
             if updated:
-                db.session.commit()
                 print(f"Updated inbox settings for {inbox.email}")
         else:
-            # Create inbox
+            # Create inbox (flush assigns the ID; everything commits together below)
             inbox = Inbox(**INBOX_CONFIG)
             db.session.add(inbox)
-            db.session.commit()
+            db.session.flush()
             print(f"Created inbox: {inbox.email} (ID: {inbox.id})")
 
-        # Check if campaign already exists
-        existing_campaign = Campaign.query.filter_by(name="Wedding Counselors Outreach").first()
+        # Check if campaign already exists; its sequences load in the same query
+        existing_campaign = Campaign.query.options(
+            joinedload(Campaign.sequences)
+        ).filter_by(name="Wedding Counselors Outreach").first()
         if existing_campaign:
             print(f"Campaign already exists (ID: {existing_campaign.id})")
             campaign = existing_campaign
+            existing_sequences = campaign.sequences
         else:
             # Create campaign
             campaign = Campaign(
@@ -153,11 +156,11 @@ def setup():
                 status="draft"  # Start as draft, activate when ready
             )
             db.session.add(campaign)
-            db.session.commit()
+            db.session.flush()
+            existing_sequences = []
             print(f"Created campaign: {campaign.name} (ID: {campaign.id})")
 
         # Create sequences if they don't exist
-        existing_sequences = Sequence.query.filter_by(campaign_id=campaign.id).all()
         existing_by_step = {seq.step_number: seq for seq in existing_sequences}
         created = 0
         updated = 0
@@ -176,8 +179,7 @@ def setup():
                 )
                 db.session.add(sequence)
                 created += 1
-        if created or updated:
-            db.session.commit()
+        db.session.commit()
         if updated:
             print(f"Updated {updated} existing email sequences")
         if created:
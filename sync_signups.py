@@ -62,9 +62,9 @@ def sync():
                     lead.status = 'signed_up'
 
                     # Stop all active campaigns for this lead
-                    active_cls = CampaignLead.query.filter_by(lead_id=lead.id, status='active').all()
-                    for cl in active_cls:
-                        cl.status = 'completed'
+                    CampaignLead.query.filter_by(lead_id=lead.id, status='active').update(
+                        {'status': 'completed'}, synchronize_session=False
+                    )
 
                     db.session.commit()
                     updated += 1
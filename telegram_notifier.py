@@ -39,6 +39,9 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
 
+# One keep-alive session so every notification in a run reuses the same TLS connection
+telegram_http = requests.Session()
+
 from app import app, _ensure_response_columns
 from models import db, Inbox, Response, Lead, CampaignLead, Campaign, SentEmail
 
@@ -61,7 +64,7 @@ def send_telegram_message(message: str) -> bool:
     }
 
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = telegram_http.post(url, json=payload, timeout=10)
         if response.status_code == 200:
             logger.info("Telegram notification sent")
             return True
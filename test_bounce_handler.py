@@ -1,14 +1,31 @@
+import base64
+import csv
 import os
 import tempfile
 import unittest
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
 
 DB_FILE = os.path.join(tempfile.gettempdir(), "email_bounce_handler_test.db")
 os.environ["DATABASE_URI"] = f"sqlite:///{DB_FILE}"
 
 from app import app  # noqa: E402
-from bounce_handler import BounceCleaner, BounceProcessor, BounceRecord, BounceType  # noqa: E402
+from bounce_handler import (  # noqa: E402
+    BounceCleaner,
+    BounceProcessor,
+    BounceRecord,
+    BounceType,
+    _find_text_plain_part,
+    _group_fetch_sections,
+    _IMAP_POOL,
+    _parse_delivery_status,
+    _parse_imap_list,
+    check_and_process_bounces,
+    get_imap,
+    watch_bounces,
+)
 from models import Campaign, CampaignLead, Inbox, Lead, db  # noqa: E402
 
 
@@ -90,6 +107,277 @@ class BounceHandlerSessionTest(unittest.TestCase):
             self.assertEqual(deleted, 1)
             self.assertIsNone(Lead.query.filter_by(email=old_bounce.email).first())
 
+    def test_export_bounced_writes_quoted_rows(self):
+        with app.app_context():
+            db.session.add_all([
+                Lead(email="b1@example.com", first_name="Smith, Jr.", status="bounced"),
+                Lead(email="b2@example.com", status="complained"),
+                Lead(email="ok@example.com", status="contacted"),
+            ])
+            db.session.commit()
+
+            path = os.path.join(tempfile.gettempdir(), "email_bounce_export_test.csv")
+            count = BounceCleaner(db.session).export_bounced(path)
+
+            with open(path, newline="") as f:
+                rows = list(csv.reader(f))
+
+            self.assertEqual(count, 2)
+            self.assertEqual(rows[0][0], "Email")
+            self.assertEqual(sorted(r[0] for r in rows[1:]), ["b1@example.com", "b2@example.com"])
+            self.assertIn("Smith, Jr.", [r[3] for r in rows[1:]])
+
+    def test_iter_bounced_leads_pages_by_id_and_report_counts(self):
+        with app.app_context():
+            db.session.add_all(
+                [Lead(email=f"b{i}@example.com", status="bounced") for i in range(5)]
+                + [Lead(email="c@example.com", status="complained"),
+                   Lead(email="ok@example.com", status="contacted")]
+            )
+            db.session.commit()
+
+            rows = list(BounceCleaner(db.session).iter_bounced_leads(page_size=2))
+            ids = [row.id for row in rows]
+            self.assertEqual(len(rows), 6)
+            self.assertEqual(ids, sorted(ids, reverse=True))
+
+            report = BounceProcessor(db.session).generate_bounce_report(days=30)
+            self.assertEqual((report["hard_bounces"], report["complaints"]), (5, 1))
+            self.assertEqual(report["total_bounced"], 6)
+            self.assertEqual(len(report["bounced_emails"]), 6)
+
+
+BOUNCE_HEADER = (
+    b"From: Mail Delivery Subsystem <mailer-daemon@example.net>\r\n"
+    b"Subject: Undeliverable: quick question\r\n"
+    b"Message-ID: <dsn-1@example.net>\r\n\r\n"
+)
+BOUNCE_TEXT = b"Delivery to <gone@example.com> failed.\r\n550 5.1.1 user unknown\r\n"
+BOUNCE_STRUCTURE = (
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "base64" 96 2 NIL NIL NIL)'
+    b'("message" "delivery-status" NIL NIL NIL "7bit" 300 NIL NIL NIL) '
+    b'"report" ("report-type" "delivery-status" "boundary" "b1") NIL NIL)'
+)
+OTHER_HEADER = b"From: Someone <someone@example.org>\r\nSubject: Hello\r\n\r\n"
+OTHER_STRUCTURE = b'("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" 17 1 NIL NIL NIL)'
+
+BOUNCE_DSN = (
+    b"Reporting-MTA: dns; mx.example.net\r\n\r\n"
+    b"Final-Recipient: rfc822; Gone@example.com\r\n"
+    b"Action: failed\r\n"
+    b"Status: 5.1.1\r\n"
+    b"Diagnostic-Code: smtp; 550 5.1.1 user unknown\r\n"
+)
+
+MESSAGES = {
+    b"1": (BOUNCE_HEADER, BOUNCE_STRUCTURE, {"1": base64.b64encode(BOUNCE_TEXT), "2": BOUNCE_DSN}),
+    b"2": (OTHER_HEADER, OTHER_STRUCTURE, {"1": b"Just saying hi.\r\n"}),
+}
+
+
+class FakeIMAP:
+    """Minimal IMAP4_SSL stand-in serving one folder of two messages."""
+
+    capabilities = ("IMAP4REV1",)
+
+    def __init__(self, *args, **kwargs):
+        self.fetch_calls = []
+        self.search_calls = []
+        self.logins = 0
+
+    def login(self, user, password):
+        self.logins += 1
+        return "OK", [b"Logged in"]
+
+    def noop(self):
+        return "OK", [b"NOOP completed"]
+
+    def status(self, folder, items):
+        if folder != '"INBOX"':
+            return "NO", [b"No such folder"]
+        return "OK", [b'"INBOX" (MESSAGES 2 UIDNEXT 3)']
+
+    def select(self, folder):
+        return ("OK", [b"2"]) if folder == "INBOX" else ("NO", [b"No such folder"])
+
+    def search(self, charset, *criteria):
+        self.search_calls.append(criteria)
+        return "OK", [b"1 2"]
+
+    def fetch(self, message_set, parts):
+        self.fetch_calls.append((message_set, parts))
+        ids = message_set if isinstance(message_set, bytes) else message_set.encode()
+        data = []
+        for msg_id in ids.split(b","):
+            header, structure, body_parts = MESSAGES[msg_id]
+            if "HEADER.FIELDS" in parts:
+                prefix = b"%s (BODYSTRUCTURE %s BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}" % (
+                    msg_id, structure, len(header))
+                data += [(prefix, header), b")"]
+            else:
+                section = parts[len("(BODY.PEEK["):-len("])")]
+                literal = body_parts[section]
+                data += [(b"%s (BODY[%s] {%d}" % (msg_id, section.encode(), len(literal)), literal), b")"]
+        return "OK", data
+
+    def logout(self):
+        return "BYE", [b""]
+
+
+class BounceFolderScanTest(unittest.TestCase):
+    def test_group_fetch_sections(self):
+        grouped = _group_fetch_sections(FakeIMAP().fetch(b"1,2", "(BODY.PEEK[HEADER.FIELDS (FROM)] BODYSTRUCTURE)")[1])
+        self.assertEqual(set(grouped), {b"1", b"2"})
+        self.assertEqual(grouped[b"1"]["HEADER.FIELDS"], BOUNCE_HEADER)
+        self.assertTrue(grouped[b"2"]["BODYSTRUCTURE"].startswith(OTHER_STRUCTURE))
+
+    def test_find_text_plain_part(self):
+        self.assertEqual(
+            _find_text_plain_part(_parse_imap_list(BOUNCE_STRUCTURE)), ("1", "base64", "utf-8"))
+        self.assertEqual(
+            _find_text_plain_part(_parse_imap_list(OTHER_STRUCTURE)), ("1", "7bit", "us-ascii"))
+
+    def test_process_bounce_folder_fetches_bodies_for_bounces_only(self):
+        fake = FakeIMAP()
+        inbox = SimpleNamespace(imap_host="imap.example.com", imap_port=993, username="u", password="p")
+        with mock.patch("imaplib.IMAP4_SSL", return_value=fake):
+            bounces = BounceProcessor(db).process_bounce_folder(inbox)
+
+        self.assertIn('OR FROM "mailer-daemon"', fake.search_calls[0][0])
+        self.assertIn('SUBJECT "undeliverable"', fake.search_calls[0][0])
+        self.assertEqual(fake.fetch_calls[0][0], b"1,2")
+        self.assertEqual(fake.fetch_calls[1:], [(b"1", "(BODY.PEEK[2])")])
+        self.assertEqual([b.email for b in bounces], ["gone@example.com"])
+        self.assertEqual(bounces[0].bounce_type, BounceType.HARD)
+        self.assertIn("5.1.1", bounces[0].reason)
+
+    def test_process_bounce_folder_falls_back_when_filter_refused(self):
+        class RefusingIMAP(FakeIMAP):
+            def search(self, charset, *criteria):
+                self.search_calls.append(criteria)
+                return ("NO", [b"Unsupported"]) if criteria[0].count("OR") else ("OK", [b""])
+
+        fake = RefusingIMAP()
+        inbox = SimpleNamespace(imap_host="imap.example.com", imap_port=993, username="u", password="p")
+        with mock.patch("imaplib.IMAP4_SSL", return_value=fake):
+            BounceProcessor(db).process_bounce_folder(inbox, folders=["INBOX"])
+
+        self.assertEqual(len(fake.search_calls), 2)
+        self.assertTrue(fake.search_calls[1][0].startswith("SINCE ") and "OR" not in fake.search_calls[1][0])
+
+    def test_dedupe_bounces_keeps_most_severe_per_address(self):
+        now = datetime.utcnow()
+        bounces = [
+            BounceRecord("a@example.com", BounceType.SOFT, "full", now),
+            BounceRecord("A@example.com", BounceType.HARD, "unknown", now),
+            BounceRecord("a@example.com", BounceType.SOFT, "full again", now),
+            BounceRecord("b@example.com", BounceType.SOFT, "full", now),
+        ]
+        deduped = BounceProcessor.dedupe_bounces(bounces)
+        self.assertEqual([(b.email, b.bounce_type) for b in deduped],
+                         [("A@example.com", BounceType.HARD), ("b@example.com", BounceType.SOFT)])
+
+    def test_parse_delivery_status(self):
+        recipients = _parse_delivery_status(
+            "Reporting-MTA: dns; mx.example.net\n\n"
+            "Original-Recipient: rfc822;<First@Example.com>\nAction: failed\nStatus: 5.1.1\n"
+            "Diagnostic-Code: smtp; 550 mailbox\n  does not exist\n\n"
+            "Final-Recipient: rfc822; later@example.com\nAction: delayed\nStatus: 4.2.2\n"
+        )
+        self.assertEqual([r["recipient"] for r in recipients], ["first@example.com", "later@example.com"])
+        self.assertEqual(recipients[0]["diagnostic-code"], "smtp; 550 mailbox does not exist")
+        self.assertEqual(recipients[1]["status"], "4.2.2")
+
+    def test_check_and_process_bounces_marks_known_leads(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            inbox = Inbox(
+                name="Sender",
+                email="sender@example.com",
+                smtp_host="smtp.example.com",
+                imap_host="imap.example.com",
+                username="sender@example.com",
+                password="secret",
+                active=True,
+            )
+            lead = Lead(email="gone@example.com", status="contacted")
+            db.session.add_all([inbox, lead])
+            db.session.commit()
+
+            with mock.patch("imaplib.IMAP4_SSL", side_effect=lambda *a, **k: FakeIMAP()):
+                result = check_and_process_bounces(app, db)
+
+            self.assertEqual(result["bounces_found"], 1)
+            self.assertEqual(Lead.query.filter_by(email="gone@example.com").first().status, "bounced")
+
+
+class ImapPoolTest(unittest.TestCase):
+    def tearDown(self):
+        _IMAP_POOL.clear()
+
+    def test_get_imap_reuses_connection_and_reconnects_on_abort(self):
+        import imaplib
+
+        inbox = SimpleNamespace(
+            imap_host="imap.example.com", imap_port=993, email="u@example.com", username="u", password="p")
+        with mock.patch("imaplib.IMAP4_SSL", side_effect=lambda *a, **k: FakeIMAP()) as connect:
+            first = get_imap(inbox)
+            self.assertIs(get_imap(inbox), first)
+            self.assertEqual(connect.call_count, 1)
+
+            first.noop = mock.Mock(side_effect=imaplib.IMAP4.abort("socket error"))
+            second = get_imap(inbox)
+
+        self.assertIsNot(second, first)
+        self.assertEqual(connect.call_count, 2)
+
+    def test_watch_bounces_scans_changed_folders(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add_all([
+                Inbox(name="Sender", email="sender@example.com", smtp_host="smtp.example.com",
+                      imap_host="imap.example.com", username="sender@example.com", password="secret", active=True),
+                Lead(email="gone@example.com", status="contacted"),
+            ])
+            db.session.commit()
+
+        fake = FakeIMAP()
+        with mock.patch("imaplib.IMAP4_SSL", return_value=fake):
+            total = watch_bounces(app, db, max_cycles=1)
+
+        self.assertEqual(total, 1)
+        self.assertEqual(fake.logins, 1)
+        self.assertEqual(_IMAP_POOL, {})
+        with app.app_context():
+            self.assertEqual(Lead.query.filter_by(email="gone@example.com").first().status, "bounced")
+
+    def test_watch_bounces_counts_rescanned_bounces_once(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add_all([
+                Inbox(name="Sender", email="sender@example.com", smtp_host="smtp.example.com",
+                      imap_host="imap.example.com", username="sender@example.com", password="secret", active=True),
+                Lead(email="gone@example.com", status="contacted"),
+            ])
+            db.session.commit()
+
+        fake = FakeIMAP()
+
+        def new_mail(seconds):
+            # INBOX changes between cycles, so the second cycle rescans it
+            fake.status = lambda folder, items: (
+                ("OK", [b'"INBOX" (MESSAGES 3 UIDNEXT 4)']) if folder == '"INBOX"' else ("NO", [b"No such folder"]))
+
+        with mock.patch("imaplib.IMAP4_SSL", return_value=fake), \
+                mock.patch("bounce_handler.time.sleep", side_effect=new_mail):
+            total = watch_bounces(app, db, max_cycles=2)
+
+        self.assertEqual(len(fake.search_calls), 2)
+        self.assertEqual(total, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -122,11 +122,13 @@ def main():
 
         print(f"Campaign: {campaign.name} (ID: {campaign.id}, Status: {campaign.status})")
 
+        existing_by_step = {
+            seq.step_number: seq
+            for seq in Sequence.query.filter_by(campaign_id=campaign.id).all()
+        }
+
         for seq_data in CONTROL_SEQUENCE:
-            seq = Sequence.query.filter_by(
-                campaign_id=campaign.id,
-                step_number=seq_data["step_number"]
-            ).first()
+            seq = existing_by_step.get(seq_data["step_number"])
 
             if seq:
                 changed = (
@@ -136,7 +138,6 @@ def main():
                 if changed:
                     seq.email_template = seq_data["email_template"]
                     seq.delay_days = seq_data["delay_days"]
-                    db.session.commit()
                     print(f"  Step {seq_data['step_number']}: UPDATED body/timing (subject unchanged: {seq.subject_template!r})")
                 else:
                     print(f"  Step {seq_data['step_number']}: OK (no changes needed)")
@@ -150,9 +151,10 @@ def main():
                     active=True,
                 )
                 db.session.add(new_seq)
-                db.session.commit()
                 print(f"  Step {seq_data['step_number']}: CREATED (subject: {seq_data['default_subject']!r})")
 
+        db.session.commit()
+
     print("\nDone. setup_ab_test.py will configure all variants next.")
 
 